@@ -4,46 +4,345 @@ Generates session titles, summaries, and structured distraction analysis using C
 """
 
 import os
+import asyncio
+import random
 import anthropic
-from datetime import datetime
-from typing import Dict, List
-import json
+import numpy as np
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+import orjson
+from string import Template
 
+import metrics
 from database import Database
 
+# Fuse title, summary and distraction breakdown into a single Claude call.
+# Set ATTUNE_FUSED_ANALYSIS=0 to fall back to three separate calls.
+USE_FUSED_ANALYSIS = os.getenv("ATTUNE_FUSED_ANALYSIS", "1") != "0"
 
-class SessionAnalyzer:
-    """Generate AI analysis for completed sessions"""
+# Seconds between status checks while waiting on a Message Batch
+BATCH_POLL_INTERVAL = 30
 
-    def __init__(self):
-        self.anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        self.db = Database()
+# Shared per process so every analyzer reuses the same HTTP/2 keep-alive pool
+# instead of setting it up again per request
+# (retries are handled by _call_with_retry, so the SDK's own are disabled)
+_ANTHROPIC = anthropic.AsyncAnthropic(
+    api_key=os.getenv("ANTHROPIC_API_KEY"),
+    http_client=anthropic.DefaultAsyncHttpxClient(http2=True),
+    max_retries=0
+)
 
-    def generate_session_title(self, goal: str, intervals: List[Dict], nudges: List[Dict]) -> str:
-        """Generate a 1-3 word title for the session using Claude"""
-        focused_count = sum(1 for i in intervals if i["focused"])
-        distracted_count = len(intervals) - focused_count
+# Prompt context caps: long sessions are sampled rather than dumped into the prompt
+MAX_PROMPT_DISTRACTIONS = 30
+MAX_EXPLANATION_CHARS = 120
 
-        try:
-            response = self.anthropic_client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=50,
-                messages=[{
-                    "role": "user",
-                    "content": f"""Generate a 1-3 word title for this focus session.
+# Sessions shorter than this (seconds) or with fewer screenshot analyses
+# get a templated result instead of Claude calls
+MIN_DURATION_FOR_LLM = 60
+MIN_ANALYSES_FOR_LLM = 2
 
-Goal: {goal}
-Focused intervals: {focused_count}
-Distracted intervals: {distracted_count}
-Nudges sent: {len(nudges)}
+
+# Static prompt instructions, sent as the system prompt; only the per-session
+# details travel in the user message.
+TITLE_SYSTEM = """Generate a 1-3 word title for a focus session.
 
 Examples of good titles: "Deep Work", "Focused Coding", "Writing Session", "Research Time"
 
 Return ONLY the title, nothing else."""
+
+DISTRACTION_SYSTEM = """Analyze the distractions from a focus tracking session and categorize them.
+
+Create 3-5 meaningful categories for these distractions and estimate total time for each category.
+
+Return ONLY a JSON object in this exact format:
+{
+  "Social Media": 120,
+  "Email/Communication": 60,
+  "News/YouTube": 90
+}
+
+Make category names concise (2-3 words max). Time should be in seconds (integer).
+Categories should be specific enough to be useful but not too granular."""
+
+ANALYSIS_SYSTEM = """Analyze a focus session and provide a thoughtful 3-4 sentence summary.
+
+Provide an analysis that:
+1. Evaluates their focus quality
+2. Mentions SPECIFIC distractions that pulled them away (be concrete!)
+3. Notes any patterns (e.g., started strong, got distracted later)
+4. Gives constructive, actionable feedback
+5. Encourages improvement if needed
+
+Write in a friendly, encouraging tone. Address the user as "you"."""
+
+
+FULL_ANALYSIS_SYSTEM = """Analyze a focus session and produce a title, a summary, and a distraction breakdown.
+
+title: a 1-3 word title for the session.
+Examples of good titles: "Deep Work", "Focused Coding", "Writing Session", "Research Time"
+
+analysis: a thoughtful 3-4 sentence summary that:
+1. Evaluates their focus quality
+2. Mentions SPECIFIC distractions that pulled them away (be concrete!)
+3. Notes any patterns (e.g., started strong, got distracted later)
+4. Gives constructive, actionable feedback
+5. Encourages improvement if needed
+Write in a friendly, encouraging tone. Address the user as "you".
+
+distractions: 3-5 meaningful categories for the detected distractions with the estimated total time for each.
+Make category names concise (2-3 words max). Time should be in seconds (integer).
+Categories should be specific enough to be useful but not too granular.
+Use an empty object if no distractions were detected.
+
+Return ONLY a JSON object with keys title, analysis, distractions in this exact format:
+{
+  "title": "Focused Coding",
+  "analysis": "You stayed on task for most of the session...",
+  "distractions": {
+    "Social Media": 120,
+    "Email/Communication": 60
+  }
+}"""
+
+
+# Per-session user messages, compiled once; calls only substitute scalar values
+TITLE_TMPL = Template("""Goal: ${goal}
+Focused intervals: ${focused_count}
+Distracted intervals: ${distracted_count}
+Nudges sent: ${nudges_count}""")
+
+DISTRACTION_TMPL = Template("""Each distraction represents approximately ${seconds_each} seconds of time.
+
+Distractions detected:
+${distraction_lines}""")
+
+_SESSION_STATS = """Session Goal: ${goal}
+
+Statistics:
+- Focus percentage: ${focus_pct}%
+- Productive time: ${productive_time}
+- Not productive time: ${not_productive_time}
+- Focused intervals: ${focused_count}
+- Distracted intervals: ${distracted_count}
+- Nudges sent: ${nudges_count}
+
+Interval pattern: ${interval_text}
+
+"""
+
+ANALYSIS_TMPL = Template(_SESSION_STATS + """Specific distractions detected:
+${distraction_details}""")
+
+FULL_ANALYSIS_TMPL = Template(_SESSION_STATS + "${distraction_text}")
+
+
+T = TypeVar("T")
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Rate limits, connection problems and 5xx/overloaded responses are worth retrying"""
+    if isinstance(error, (anthropic.RateLimitError, anthropic.APIConnectionError, anthropic.InternalServerError)):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code >= 500
+
+
+async def _call_with_retry(
+    fn: Callable[[], Awaitable[T]],
+    *,
+    max_attempts: int = 5,
+    base: float = 0.5
+) -> T:
+    """
+    Await fn(), retrying transient Anthropic errors with exponential backoff and jitter
+    Non-retryable errors (e.g. 400 bad request) and the final failure are re-raised
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt == max_attempts or not _is_retryable(e):
+                raise
+            delay = base * 2 ** (attempt - 1) + random.uniform(0, base)
+            print(f"⚠️  Claude call failed ({type(e).__name__}), retry {attempt}/{max_attempts - 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class AnalysesSummary:
+    """One pass over a session's screenshot analyses, shared by the analysis helpers"""
+    analyses: List[Dict]
+    timestamps: np.ndarray
+    focused_mask: np.ndarray
+    focused_count: int
+    distracted_count: int
+    avg_interval: float
+
+    @property
+    def distracted(self) -> List[Dict]:
+        return [a for a, focused in zip(self.analyses, self.focused_mask) if not focused]
+
+
+def _summarize_analyses(screenshot_analyses: List[Dict]) -> AnalysesSummary:
+    """Parse timestamps and focus flags once for the prompt-building helpers"""
+    timestamps = metrics.parse_timestamps(screenshot_analyses)
+    focused_mask = metrics.focused_mask(screenshot_analyses)
+
+    if len(timestamps) > 1:
+        span = (timestamps[-1] - timestamps[0]) / np.timedelta64(1, "s")
+        avg_interval = float(span) / (len(timestamps) - 1)
+    else:
+        avg_interval = 30  # Default assumption
+
+    focused_count = int(focused_mask.sum())
+
+    return AnalysesSummary(
+        analyses=screenshot_analyses,
+        timestamps=timestamps,
+        focused_mask=focused_mask,
+        focused_count=focused_count,
+        distracted_count=len(focused_mask) - focused_count,
+        avg_interval=avg_interval
+    )
+
+
+def _extract_json(text: str):
+    """Parse JSON from a Claude response (handles markdown code blocks)"""
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0].strip()
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0].strip()
+    return orjson.loads(text)
+
+
+def _interval_pattern(intervals: List[Dict]) -> str:
+    """Summarize the first intervals as 'HH:MM: state' pairs"""
+    interval_summary = []
+    for interval in intervals[:10]:  # Limit to first 10 for context
+        start = metrics.parse_ts(interval["interval_time_started"])
+        state = "focused" if interval["focused"] else "distracted"
+        interval_summary.append(f"{start.strftime('%H:%M')}: {state}")
+
+    interval_text = ", ".join(interval_summary)
+    if len(intervals) > 10:
+        interval_text += f", ... ({len(intervals) - 10} more intervals)"
+    return interval_text
+
+
+def _needs_llm(total_time: int, analyses_count: int) -> bool:
+    """Whether a session has enough data to be worth analyzing with Claude"""
+    return total_time >= MIN_DURATION_FOR_LLM and analyses_count >= MIN_ANALYSES_FOR_LLM
+
+
+def _quick_session_result(goal: str, total_time: int) -> tuple:
+    """Templated (title, analysis, distractions) for sessions too short to analyze"""
+    return "Quick Session", f"You spent {total_time}s on {goal}. Not enough data to analyze.", {}
+
+
+def _clip(text: str, limit: int = MAX_EXPLANATION_CHARS) -> str:
+    """Truncate an explanation for prompt use"""
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def _distraction_list(distracted_analyses: List[Dict], avg_interval: float) -> str:
+    """
+    Describe the distractions for a prompt, numbered with timestamps
+    Sessions with many distractions are sampled evenly across the session
+    """
+    sample = distracted_analyses
+    if len(sample) > MAX_PROMPT_DISTRACTIONS:
+        idx = np.linspace(0, len(sample) - 1, MAX_PROMPT_DISTRACTIONS, dtype=int)
+        sample = [distracted_analyses[i] for i in idx]
+
+    # Sampled lines stand in for the skipped ones, so each covers more time
+    seconds_each = avg_interval * len(distracted_analyses) / len(sample) if sample else avg_interval
+
+    lines = []
+    if len(sample) < len(distracted_analyses):
+        lines.append(f"Showing a representative sample of {len(sample)} of {len(distracted_analyses)} distractions")
+    for i, analysis in enumerate(sample, 1):
+        time_str = metrics.parse_ts(analysis["timestamp"]).strftime('%H:%M:%S')
+        lines.append(f"{i}. [{time_str}] {_clip(analysis['explanation'])}")
+    if not sample:
+        lines.append("None")
+    return DISTRACTION_TMPL.substitute(
+        seconds_each=f"{seconds_each:.0f}",
+        distraction_lines="\n".join(lines)
+    )
+
+
+def _session_stats(
+    goal: str,
+    intervals: List[Dict],
+    nudges: List[Dict],
+    focus_percentage: float,
+    productive_time: int,
+    not_productive_time: int
+) -> Dict:
+    """Scalar values for the session statistics block of the analysis prompts"""
+    focused_count = sum(1 for i in intervals if i["focused"])
+    return {
+        "goal": goal,
+        "focus_pct": f"{focus_percentage:.1f}",
+        "productive_time": f"{productive_time // 60}m {productive_time % 60}s",
+        "not_productive_time": f"{not_productive_time // 60}m {not_productive_time % 60}s",
+        "focused_count": focused_count,
+        "distracted_count": len(intervals) - focused_count,
+        "nudges_count": len(nudges),
+        "interval_text": _interval_pattern(intervals)
+    }
+
+
+class SessionAnalyzer:
+    """Generate AI analysis for completed sessions"""
+
+    def __init__(self, db: Optional[Database] = None):
+        self.anthropic_client = _ANTHROPIC
+        self.db = db or Database.instance()
+
+    async def warm_up(self):
+        """Open a keep-alive connection to the Anthropic API ahead of the first analysis"""
+        try:
+            await self.anthropic_client.models.list(limit=1)
+        except Exception as e:
+            print(f"⚠️  Could not warm up Anthropic connection: {e}")
+
+    async def generate_session_title(
+        self,
+        goal: str,
+        focused_count: int,
+        distracted_count: int,
+        nudges_count: int
+    ) -> str:
+        """
+        Generate a 1-3 word title for the session using Claude
+        Only used when the fused analysis is off or fails
+        """
+        async def stream_title() -> str:
+            # Titles are a few tokens; stream and stop at the first line break
+            title = ""
+            async with self.anthropic_client.messages.stream(
+                model="claude-sonnet-4-20250514",
+                max_tokens=10,
+                system=TITLE_SYSTEM,
+                messages=[{
+                    "role": "user",
+                    "content": TITLE_TMPL.substitute(
+                        goal=goal,
+                        focused_count=focused_count,
+                        distracted_count=distracted_count,
+                        nudges_count=nudges_count
+                    )
                 }]
-            )
+            ) as stream:
+                async for text in stream.text_stream:
+                    title += text
+                    if "\n" in title or len(title) > 40:
+                        break
+            return title
 
-            title = response.content[0].text.strip()
+        try:
+            title = await _call_with_retry(stream_title)
+            title = title.strip().split("\n")[0].strip()
             # Remove quotes if present
             title = title.strip('"').strip("'")
             return title
@@ -52,86 +351,61 @@ Return ONLY the title, nothing else."""
             print(f"❌ Error generating title: {e}")
             return "Focus Session"
 
-    def analyze_distractions(self, session_id: str) -> Dict[str, int]:
+    async def analyze_distractions(
+        self,
+        session_id: str,
+        summary: Optional[AnalysesSummary] = None
+    ) -> Dict[str, int]:
         """
         Create structured output of distractions with time spent
         Uses Claude to analyze all screenshot analyses and categorize distractions
+        Only used when the fused analysis is off or fails
         Returns: {distraction_type: seconds}
         """
         # Get all screenshot analyses from temporary storage
-        screenshot_analyses = self.db.get_screenshot_analyses(session_id)
-        
+        if summary is None:
+            summary = _summarize_analyses(self.db.get_screenshot_analyses(session_id))
+
         # Filter only distracted ones
-        distracted_analyses = [a for a in screenshot_analyses if not a["focused"]]
-        
+        distracted_analyses = summary.distracted
+
         if not distracted_analyses:
             return {}
-        
-        # Build a summary of all distractions with timestamps
-        distraction_summary = []
-        for i, analysis in enumerate(distracted_analyses, 1):
-            timestamp = datetime.fromisoformat(analysis["timestamp"])
-            time_str = timestamp.strftime('%H:%M:%S')
-            distraction_summary.append(f"{i}. [{time_str}] {analysis['explanation']}")
-        
-        distraction_text = "\n".join(distraction_summary)
-        
-        # Calculate time between screenshots (approximate duration for each)
-        if len(screenshot_analyses) > 1:
-            # Calculate average time between screenshots
-            times = [datetime.fromisoformat(a["timestamp"]) for a in screenshot_analyses]
-            time_diffs = [(times[i+1] - times[i]).total_seconds() for i in range(len(times)-1)]
-            avg_interval = sum(time_diffs) / len(time_diffs) if time_diffs else 30
-        else:
-            avg_interval = 30  # Default assumption
-        
+
+        # Time between screenshots (approximate duration for each)
+        avg_interval = summary.avg_interval
+
+        # Build a summary of the distractions with timestamps
+        distraction_text = _distraction_list(distracted_analyses, avg_interval)
+        total_distraction_time = len(distracted_analyses) * int(avg_interval)
+
         try:
             # Use Claude to categorize distractions
-            response = self.anthropic_client.messages.create(
+            response = await _call_with_retry(lambda: self.anthropic_client.messages.create(
                 model="claude-sonnet-4-20250514",
-                max_tokens=500,
+                max_tokens=300,
+                # The categories object is flat, so its first "}" ends the answer
+                stop_sequences=["}"],
+                system=DISTRACTION_SYSTEM,
                 messages=[{
                     "role": "user",
-                    "content": f"""Analyze these distractions from a focus tracking session and categorize them.
-
-Each distraction represents approximately {avg_interval:.0f} seconds of time.
-
-Distractions detected:
-{distraction_text}
-
-Create 3-5 meaningful categories for these distractions and estimate total time for each category.
-
-Return ONLY a JSON object in this exact format:
-{{
-  "Social Media": 120,
-  "Email/Communication": 60,
-  "News/YouTube": 90
-}}
-
-Make category names concise (2-3 words max). Time should be in seconds (integer).
-Categories should be specific enough to be useful but not too granular."""
+                    "content": distraction_text
                 }]
-            )
+            ))
+
+            result_text = response.content[0].text
+            if response.stop_reason == "stop_sequence":
+                result_text += "}"
+            distraction_data = _extract_json(result_text.strip())
 
-            result_text = response.content[0].text.strip()
-            
-            # Extract JSON from response (handle markdown code blocks)
-            if "```json" in result_text:
-                result_text = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                result_text = result_text.split("```")[1].split("```")[0].strip()
-            
-            distraction_data = json.loads(result_text)
-            
             return distraction_data
 
         except Exception as e:
             print(f"❌ Error analyzing distractions with Claude: {e}")
             # Fallback: return generic categorization
-            total_distraction_time = len(distracted_analyses) * int(avg_interval)
             return {"General distraction": total_distraction_time}
 
-    def generate_session_analysis(
+    async def generate_session_analysis(
         self,
         goal: str,
         intervals: List[Dict],
@@ -139,76 +413,42 @@ Categories should be specific enough to be useful but not too granular."""
         focus_percentage: float,
         productive_time: int,
         not_productive_time: int,
-        session_id: str
+        session_id: str,
+        summary: Optional[AnalysesSummary] = None
     ) -> str:
         """Generate a paragraph analysis of the session using Claude"""
 
-        focused_count = sum(1 for i in intervals if i["focused"])
-        distracted_count = len(intervals) - focused_count
-
-        # Build interval summary
-        interval_summary = []
-        for i, interval in enumerate(intervals[:10]):  # Limit to first 10 for context
-            start = datetime.fromisoformat(interval["interval_time_started"])
-            duration_str = f"{start.strftime('%H:%M')}"
-            state = "focused" if interval["focused"] else "distracted"
-            interval_summary.append(f"{duration_str}: {state}")
-
-        interval_text = ", ".join(interval_summary)
-        if len(intervals) > 10:
-            interval_text += f", ... ({len(intervals) - 10} more intervals)"
-
         # Get screenshot analyses to include specific distractions
-        screenshot_analyses = self.db.get_screenshot_analyses(session_id)
-        distracted_analyses = [a for a in screenshot_analyses if not a["focused"]]
-        
+        if summary is None:
+            summary = _summarize_analyses(self.db.get_screenshot_analyses(session_id))
+        distracted_analyses = summary.distracted
+
         # Build distraction details (limit to show variety)
         distraction_examples = []
         if distracted_analyses:
-            # Show up to 5 examples spread across the session
-            step = max(1, len(distracted_analyses) // 5)
-            sample_distractions = distracted_analyses[::step][:5]
-            
+            # Show up to 5 examples spread evenly across the session
+            idx = np.linspace(0, len(distracted_analyses) - 1, min(5, len(distracted_analyses)), dtype=int)
+            sample_distractions = [distracted_analyses[i] for i in idx]
+
             for analysis in sample_distractions:
-                timestamp = datetime.fromisoformat(analysis["timestamp"])
-                time_str = timestamp.strftime('%H:%M')
-                distraction_examples.append(f"[{time_str}] {analysis['explanation']}")
+                time_str = metrics.parse_ts(analysis["timestamp"]).strftime('%H:%M')
+                distraction_examples.append(f"[{time_str}] {_clip(analysis['explanation'])}")
         
         distraction_details = "\n".join(distraction_examples) if distraction_examples else "None"
 
         try:
-            response = self.anthropic_client.messages.create(
+            response = await _call_with_retry(lambda: self.anthropic_client.messages.create(
                 model="claude-sonnet-4-20250514",
-                max_tokens=350,
+                max_tokens=250,
+                system=ANALYSIS_SYSTEM,
                 messages=[{
                     "role": "user",
-                    "content": f"""Analyze this focus session and provide a thoughtful 3-4 sentence summary.
-
-Session Goal: {goal}
-
-Statistics:
-- Focus percentage: {focus_percentage:.1f}%
-- Productive time: {productive_time // 60}m {productive_time % 60}s
-- Not productive time: {not_productive_time // 60}m {not_productive_time % 60}s
-- Focused intervals: {focused_count}
-- Distracted intervals: {distracted_count}
-- Nudges sent: {len(nudges)}
-
-Interval pattern: {interval_text}
-
-Specific distractions detected:
-{distraction_details}
-
-Provide an analysis that:
-1. Evaluates their focus quality
-2. Mentions SPECIFIC distractions that pulled them away (be concrete!)
-3. Notes any patterns (e.g., started strong, got distracted later)
-4. Gives constructive, actionable feedback
-5. Encourages improvement if needed
-
-Write in a friendly, encouraging tone. Address the user as "you"."""
+                    "content": ANALYSIS_TMPL.substitute(
+                        _session_stats(goal, intervals, nudges, focus_percentage, productive_time, not_productive_time),
+                        distraction_details=distraction_details
+                    )
                 }]
-            )
+            ))
 
             analysis = response.content[0].text.strip()
             return analysis
@@ -217,75 +457,157 @@ Write in a friendly, encouraging tone. Address the user as "you"."""
             print(f"❌ Error generating analysis: {e}")
             return f"You worked on: {goal}. Your focus percentage was {focus_percentage:.1f}%."
 
-    def analyze_and_end_session(self, session_id: str) -> Dict:
+    async def generate_full_analysis(
+        self,
+        goal: str,
+        intervals: List[Dict],
+        nudges: List[Dict],
+        focus_percentage: float,
+        productive_time: int,
+        not_productive_time: int,
+        session_id: str,
+        summary: Optional[AnalysesSummary] = None
+    ) -> Optional[Dict]:
+        """
+        Generate title, analysis and distraction breakdown in a single Claude call
+        Returns: {"title": str, "analysis": str, "distractions": {distraction_type: seconds}}
+        or None if the call fails, so callers can fall back to the separate methods
+        """
+        params = self._full_analysis_params(
+            goal, intervals, nudges, focus_percentage, productive_time, not_productive_time,
+            session_id, summary
+        )
+
+        try:
+            response = await _call_with_retry(lambda: self.anthropic_client.messages.create(**params))
+            return self._parse_full_analysis(response.content[0].text)
+
+        except Exception as e:
+            print(f"❌ Error generating fused analysis: {e}")
+            return None
+
+    def _full_analysis_params(
+        self,
+        goal: str,
+        intervals: List[Dict],
+        nudges: List[Dict],
+        focus_percentage: float,
+        productive_time: int,
+        not_productive_time: int,
+        session_id: str,
+        summary: Optional[AnalysesSummary] = None
+    ) -> Dict:
+        """Build the messages.create parameters for the fused analysis prompt"""
+        if summary is None:
+            summary = _summarize_analyses(self.db.get_screenshot_analyses(session_id))
+        distracted_analyses = summary.distracted
+        distraction_text = _distraction_list(distracted_analyses, summary.avg_interval)
+
+        return {
+            "model": "claude-sonnet-4-20250514",
+            "max_tokens": 600,
+            "system": FULL_ANALYSIS_SYSTEM,
+            "messages": [{
+                "role": "user",
+                "content": FULL_ANALYSIS_TMPL.substitute(
+                    _session_stats(goal, intervals, nudges, focus_percentage, productive_time, not_productive_time),
+                    distraction_text=distraction_text
+                )
+            }]
+        }
+
+    @staticmethod
+    def _parse_full_analysis(text: str) -> Dict:
+        """Parse the fused analysis JSON into title, analysis and distractions"""
+        result = _extract_json(text.strip())
+
+        return {
+            "title": str(result["title"]).strip().strip('"').strip("'"),
+            "analysis": str(result["analysis"]).strip(),
+            "distractions": dict(result.get("distractions") or {})
+        }
+
+    async def analyze_and_end_session(self, session_id: str) -> Dict:
         """
         Complete analysis for a session and update database
         Returns session data with analysis
         """
-        # Get session data
-        session = self.db.get_session(session_id)
-        if not session:
+        # Get session data with its intervals and nudges
+        bundle = self.db.get_session_bundle(session_id)
+        if not bundle:
             raise ValueError(f"Session {session_id} not found")
+        session = bundle["session"]
 
-        if session["status"] != "active":
+        # "analyzing" means the API has already stopped the session and handed it to us
+        if session["status"] not in ("active", "analyzing"):
             raise ValueError(f"Session {session_id} is not active")
 
-        # Get screenshot analyses (source of truth), intervals, and nudges
-        screenshot_analyses = self.db.get_screenshot_analyses(session_id)
-        intervals = self.db.get_session_intervals(session_id)
-        nudges = self.db.get_session_nudges(session_id)
+        # Get screenshot analyses (source of truth)
+        summary = _summarize_analyses(self.db.get_screenshot_analyses(session_id))
+        intervals = bundle["intervals"]
+        nudges = bundle["nudges"]
 
         # Calculate metrics from screenshot_analyses (more accurate than intervals)
-        productive_time = 0
-        not_productive_time = 0
-
-        if screenshot_analyses:
-            for i, analysis in enumerate(screenshot_analyses):
-                # Calculate duration: time until next screenshot, or estimate for last one
-                if i < len(screenshot_analyses) - 1:
-                    current_time = datetime.fromisoformat(analysis["timestamp"])
-                    next_time = datetime.fromisoformat(screenshot_analyses[i + 1]["timestamp"])
-                    duration = int((next_time - current_time).total_seconds())
-                else:
-                    # For the last analysis, use ~30 seconds estimate
-                    duration = 30
-
-                if analysis["focused"]:
-                    productive_time += duration
-                else:
-                    not_productive_time += duration
-
-        total_time = productive_time + not_productive_time
-        focus_percentage = (productive_time / total_time * 100) if total_time > 0 else 0
+        durations = self.db.get_session_duration_summary(session_id, last_duration=30)
+        productive_time = durations["productive_time"]
+        not_productive_time = durations["not_productive_time"]
 
-        # Count focused/distracted for AI analysis context
-        focused_count = sum(1 for a in screenshot_analyses if a["focused"])
-        distracted_count = len(screenshot_analyses) - focused_count
+        focus_percentage = metrics.focus_percentage(productive_time, not_productive_time)
 
         print(f"\n📊 Analyzing session...")
-        print(f"  Total analyses: {len(screenshot_analyses)}")
-        print(f"  Focused: {focused_count}, Distracted: {distracted_count}")
+        print(f"  Total analyses: {len(summary.analyses)}")
+        print(f"  Focused: {summary.focused_count}, Distracted: {summary.distracted_count}")
         print(f"  Nudges: {len(nudges)}")
         print(f"  Focus: {focus_percentage:.1f}%")
 
-        # Generate AI content
-        print(f"\n🤖 Generating AI analysis...")
-        title = self.generate_session_title(session["goal"], intervals, nudges)
+        total_time = productive_time + not_productive_time
+        if not _needs_llm(total_time, len(summary.analyses)):
+            # Not enough data for a meaningful analysis, skip Claude entirely
+            print(f"\n⏭️  Session too short for AI analysis")
+            title, ai_analysis, ai_structured_output = _quick_session_result(session["goal"], total_time)
+        else:
+            # Generate AI content
+            print(f"\n🤖 Generating AI analysis...")
+            result = None
+            if USE_FUSED_ANALYSIS:
+                result = await self.generate_full_analysis(
+                    goal=session["goal"],
+                    intervals=intervals,
+                    nudges=nudges,
+                    focus_percentage=focus_percentage,
+                    productive_time=productive_time,
+                    not_productive_time=not_productive_time,
+                    session_id=session_id,
+                    summary=summary
+                )
+
+            if result:
+                title = result["title"]
+                ai_analysis = result["analysis"]
+                ai_structured_output = result["distractions"]
+            else:
+                focused_intervals = sum(1 for i in intervals if i["focused"])
+
+                # The three calls are independent, so run them concurrently
+                title, ai_analysis, ai_structured_output = await asyncio.gather(
+                    self.generate_session_title(
+                        session["goal"], focused_intervals, len(intervals) - focused_intervals, len(nudges)
+                    ),
+                    self.generate_session_analysis(
+                        goal=session["goal"],
+                        intervals=intervals,
+                        nudges=nudges,
+                        focus_percentage=focus_percentage,
+                        productive_time=productive_time,
+                        not_productive_time=not_productive_time,
+                        session_id=session_id,
+                        summary=summary
+                    ),
+                    # Analyze distractions using screenshot analyses
+                    self.analyze_distractions(session_id, summary=summary)
+                )
         print(f"  ✓ Title: {title}")
-
-        ai_analysis = self.generate_session_analysis(
-            goal=session["goal"],
-            intervals=intervals,
-            nudges=nudges,
-            focus_percentage=focus_percentage,
-            productive_time=productive_time,
-            not_productive_time=not_productive_time,
-            session_id=session_id
-        )
         print(f"  ✓ Analysis generated")
-
-        # Analyze distractions using screenshot analyses
-        ai_structured_output = self.analyze_distractions(session_id)
         print(f"  ✓ Distraction breakdown: {ai_structured_output}")
 
         # NOTE: We keep screenshot_analyses for completed sessions
@@ -309,18 +631,129 @@ Write in a friendly, encouraging tone. Address the user as "you"."""
         # Return updated session
         return self.db.get_session(session_id)
 
+    async def analyze_sessions_batch(self, session_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Analyze and end many sessions through the Message Batches API (50% cheaper)
+        Intended for non-interactive work such as backfills; blocks until the batch ends.
+        Sessions whose batch request fails are analyzed synchronously instead.
+        Returns: {session_id: session}
+        """
+        results = {}
+        pending = {}
+        batch_requests = []
+
+        for session_id in session_ids:
+            bundle = self.db.get_session_bundle(session_id)
+            if not bundle or bundle["session"]["status"] not in ("active", "analyzing"):
+                print(f"⚠️  Skipping session {session_id}: not found or already completed")
+                continue
+
+            session = bundle["session"]
+            summary = _summarize_analyses(self.db.get_screenshot_analyses(session_id))
+            intervals = bundle["intervals"]
+            nudges = bundle["nudges"]
+
+            durations = self.db.get_session_duration_summary(session_id, last_duration=30)
+            productive_time = durations["productive_time"]
+            not_productive_time = durations["not_productive_time"]
+            focus_percentage = metrics.focus_percentage(productive_time, not_productive_time)
+
+            total_time = productive_time + not_productive_time
+            if not _needs_llm(total_time, len(summary.analyses)):
+                title, ai_analysis, ai_structured_output = _quick_session_result(session["goal"], total_time)
+                self.db.end_session(
+                    session_id=session_id,
+                    title=title,
+                    focus_percentage=focus_percentage,
+                    productive_time=productive_time,
+                    not_productive_time=not_productive_time,
+                    nudges_received=len(nudges),
+                    ai_analysis=ai_analysis,
+                    ai_structured_output=ai_structured_output
+                )
+                results[session_id] = self.db.get_session(session_id)
+                continue
+
+            pending[session_id] = {
+                "focus_percentage": focus_percentage,
+                "productive_time": productive_time,
+                "not_productive_time": not_productive_time,
+                "nudges_received": len(nudges)
+            }
+            batch_requests.append({
+                "custom_id": session_id,
+                "params": self._full_analysis_params(
+                    session["goal"], intervals, nudges, focus_percentage,
+                    productive_time, not_productive_time, session_id, summary
+                )
+            })
+
+        if not batch_requests:
+            return results
+
+        batch = await _call_with_retry(
+            lambda: self.anthropic_client.messages.batches.create(requests=batch_requests)
+        )
+        print(f"\n📦 Submitted batch {batch.id} with {len(batch_requests)} sessions")
+
+        while batch.processing_status != "ended":
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            batch = await _call_with_retry(lambda: self.anthropic_client.messages.batches.retrieve(batch.id))
+
+        async for entry in await self.anthropic_client.messages.batches.results(batch.id):
+            session_id = entry.custom_id
+            if session_id not in pending:
+                continue
+
+            try:
+                if entry.result.type != "succeeded":
+                    raise ValueError(f"batch request {entry.result.type}")
+                analysis = self._parse_full_analysis(entry.result.message.content[0].text)
+            except Exception as e:
+                print(f"❌ Batch analysis failed for {session_id}: {e}")
+                continue
+
+            self.db.end_session(
+                session_id=session_id,
+                title=analysis["title"],
+                ai_analysis=analysis["analysis"],
+                ai_structured_output=analysis["distractions"],
+                **pending.pop(session_id)
+            )
+            results[session_id] = self.db.get_session(session_id)
+            print(f"  ✓ {session_id}: {analysis['title']}")
+
+        # Anything left over errored or expired in the batch
+        for session_id in pending:
+            try:
+                results[session_id] = await self.analyze_and_end_session(session_id)
+            except Exception as e:
+                print(f"❌ Error analyzing session {session_id}: {e}")
+                self.db.set_session_status(session_id, "active")
+
+        return results
+
 
 if __name__ == "__main__":
     import sys
 
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+
+    if len(args) < 1:
         print("Usage: python analysis.py <session_id>")
+        print("       python analysis.py --batch <session_id> [<session_id> ...]")
         sys.exit(1)
 
-    session_id = sys.argv[1]
+    if args[0] == "--batch":
+        results = asyncio.run(SessionAnalyzer().analyze_sessions_batch(args[1:]))
+        for result in results.values():
+            print(f"{result['id']}: {result['title']} ({result['focus_percentage']:.1f}%)")
+        sys.exit(0)
+
+    session_id = args[0]
 
     analyzer = SessionAnalyzer()
-    result = analyzer.analyze_and_end_session(session_id)
+    result = asyncio.run(analyzer.analyze_and_end_session(session_id))
 
     print("\n" + "="*60)
     print("SESSION COMPLETE")
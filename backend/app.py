@@ -3,21 +3,38 @@ FastAPI backend for Focus Tracker
 Handles session management, analysis requests, and data persistence
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import Optional
-import uuid
+from typing import Optional, List
+from contextlib import asynccontextmanager
 from datetime import datetime
+import asyncio
 import subprocess
 import signal
 import os
 
-from database import Database
+import metrics
+from database import Database, new_session_id
 from monitor import FocusMonitor
 from analysis import SessionAnalyzer
 
-app = FastAPI(title="Focus Tracker API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared database handle and analyzer once per process"""
+    app.state.db = Database.instance()
+    # Background analyses don't survive a restart; reopen any session left mid-analysis
+    stale = app.state.db.reset_analyzing_sessions()
+    if stale:
+        print(f"⚠️  Reopened {stale} session(s) interrupted during analysis")
+    app.state.analyzer = SessionAnalyzer(db=app.state.db)
+    # Prime the Anthropic connection pool so the first session end skips the TLS handshake
+    await app.state.analyzer.warm_up()
+    yield
+    app.state.db.close()
+
+app = FastAPI(title="Focus Tracker API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Enable CORS for React frontend
 app.add_middleware(
@@ -33,12 +50,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize database
-db = Database()
-
 # Store active monitoring sessions
 active_monitors = {}
 
+# Longest wait (seconds) for a stopped monitor's final flush before analysis starts anyway
+MONITOR_STOP_TIMEOUT = 120
+
 # ============= REQUEST/RESPONSE MODELS =============
 
 class SessionCreate(BaseModel):
@@ -63,6 +80,19 @@ class NudgeCreate(BaseModel):
     session_id: str
     reason: str
 
+class BatchAnalyzeRequest(BaseModel):
+    session_ids: List[str]
+
+# ============= DEPENDENCIES =============
+
+def get_db(request: Request) -> Database:
+    """Shared database handle created in lifespan"""
+    return request.app.state.db
+
+def get_analyzer(request: Request) -> SessionAnalyzer:
+    """Shared session analyzer created in lifespan"""
+    return request.app.state.analyzer
+
 # ============= HEALTH CHECK =============
 
 @app.get("/")
@@ -76,7 +106,7 @@ def health():
 # ============= USER ENDPOINTS =============
 
 @app.get("/api/user/stats")
-def get_user_stats():
+def get_user_stats(db: Database = Depends(get_db)):
     """Get user statistics"""
     try:
         stats = db.get_user_stats()
@@ -87,17 +117,17 @@ def get_user_stats():
 # ============= SESSION ENDPOINTS =============
 
 @app.post("/api/sessions")
-def create_session(session_data: SessionCreate):
+def create_session(session_data: SessionCreate, db: Database = Depends(get_db)):
     """Create a new session"""
     try:
-        session_id = str(uuid.uuid4())
+        session_id = new_session_id()
         session = db.create_session(session_id, session_data.goal)
         return session
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/sessions/{session_id}")
-def get_session(session_id: str):
+def get_session(session_id: str, db: Database = Depends(get_db)):
     """Get session details"""
     session = db.get_session(session_id)
     if not session:
@@ -105,7 +135,7 @@ def get_session(session_id: str):
     return session
 
 @app.get("/api/sessions")
-def get_all_sessions(limit: int = 50):
+def get_all_sessions(limit: int = 50, db: Database = Depends(get_db)):
     """Get all sessions for the user"""
     try:
         sessions = db.get_all_sessions(limit=limit)
@@ -114,7 +144,7 @@ def get_all_sessions(limit: int = 50):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/sessions/{session_id}/end")
-def end_session(session_id: str, data: SessionEndRequest):
+def end_session(session_id: str, data: SessionEndRequest, db: Database = Depends(get_db)):
     """End a session and save final analysis"""
     try:
         if not db.check_session_active(session_id):
@@ -138,7 +168,7 @@ def end_session(session_id: str, data: SessionEndRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/sessions/{session_id}/active")
-def check_session_active(session_id: str):
+def check_session_active(session_id: str, db: Database = Depends(get_db)):
     """Check if a session is active"""
     active = db.check_session_active(session_id)
     is_monitoring = session_id in active_monitors
@@ -148,7 +178,7 @@ def check_session_active(session_id: str):
     }
 
 @app.post("/api/sessions/{session_id}/start-monitoring")
-async def start_monitoring(session_id: str, background_tasks: BackgroundTasks):
+async def start_monitoring(session_id: str, background_tasks: BackgroundTasks, db: Database = Depends(get_db)):
     """Start monitoring a session"""
     try:
         # Check if session exists and is active
@@ -167,9 +197,9 @@ async def start_monitoring(session_id: str, background_tasks: BackgroundTasks):
         # Start monitoring in background
         def run_monitor():
             try:
-                monitor = FocusMonitor(session_id, session['goal'], screenshot_interval=30)
+                monitor = FocusMonitor(session_id, session['goal'], screenshot_interval=30, db=db)
                 active_monitors[session_id] = monitor
-                monitor.monitor_loop()
+                asyncio.run(monitor.monitor_loop())
             except Exception as e:
                 print(f"Monitor error for session {session_id}: {e}")
             finally:
@@ -188,18 +218,36 @@ async def start_monitoring(session_id: str, background_tasks: BackgroundTasks):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/sessions/{session_id}/stop-monitoring")
-async def stop_monitoring(session_id: str):
-    """Stop monitoring a session and trigger analysis"""
+async def run_session_analysis(analyzer: SessionAnalyzer, session_id: str, monitor: Optional[FocusMonitor] = None):
+    """Analyze and end a session, reopening it if analysis fails so it can be retried"""
+    # The monitor writes its last interval and buffered rows as it shuts down
+    if monitor and not await asyncio.to_thread(monitor.done.wait, MONITOR_STOP_TIMEOUT):
+        print(f"⚠️  Monitor for session {session_id} did not stop in time; analyzing anyway")
     try:
-        # Check if session is being monitored
-        if session_id not in active_monitors:
-            # Session might have already stopped, check if it's active in DB
-            if not db.check_session_active(session_id):
-                raise HTTPException(status_code=400, detail="Session is not active")
+        await analyzer.analyze_and_end_session(session_id)
+    except Exception as e:
+        print(f"❌ Error analyzing session {session_id}: {e}")
+        analyzer.db.set_session_status(session_id, "active")
 
-        # Stop the monitor by marking session as inactive (the monitor checks this)
-        # The monitor loop will detect this and stop
+async def run_batch_analysis(analyzer: SessionAnalyzer, session_ids: List[str]):
+    """Analyze and end sessions as a batch, reopening any left unfinished if the batch fails"""
+    try:
+        await analyzer.analyze_sessions_batch(session_ids)
+    except Exception as e:
+        print(f"❌ Error analyzing batch: {e}")
+        for session_id in session_ids:
+            session = analyzer.db.get_session(session_id)
+            if session and session["status"] != "completed":
+                analyzer.db.set_session_status(session_id, "active")
+
+@app.post("/api/sessions/{session_id}/stop-monitoring", status_code=202)
+async def stop_monitoring(session_id: str, background_tasks: BackgroundTasks, db: Database = Depends(get_db), analyzer: SessionAnalyzer = Depends(get_analyzer)):
+    """Stop monitoring a session and trigger analysis in the background"""
+    try:
+        # A stopped monitor stays in active_monitors until its loop exits, so go by
+        # the DB status (already "analyzing" after a first stop)
+        if not db.check_session_active(session_id):
+            raise HTTPException(status_code=400, detail="Session is not active")
 
         # Get session summary from monitor if it exists
         monitor = active_monitors.get(session_id)
@@ -207,30 +255,13 @@ async def stop_monitoring(session_id: str):
             summary = monitor.get_session_summary()
         else:
             # Calculate summary from screenshot_analyses (source of truth)
-            analyses = db.get_screenshot_analyses(session_id)
+            # For the last analysis, use ~30 seconds estimate
+            durations = db.get_session_duration_summary(session_id, last_duration=30)
             nudges = db.get_session_nudges(session_id)
 
-            productive_time = 0
-            not_productive_time = 0
-
-            if analyses:
-                for i, analysis in enumerate(analyses):
-                    # Calculate duration: time until next screenshot, or estimate for last one
-                    if i < len(analyses) - 1:
-                        current_time = datetime.fromisoformat(analysis["timestamp"])
-                        next_time = datetime.fromisoformat(analyses[i + 1]["timestamp"])
-                        duration = int((next_time - current_time).total_seconds())
-                    else:
-                        # For the last analysis, use ~30 seconds estimate
-                        duration = 30
-
-                    if analysis["focused"]:
-                        productive_time += duration
-                    else:
-                        not_productive_time += duration
-
-            total_time = productive_time + not_productive_time
-            focus_percentage = (productive_time / total_time * 100) if total_time > 0 else 0
+            productive_time = durations["productive_time"]
+            not_productive_time = durations["not_productive_time"]
+            focus_percentage = metrics.focus_percentage(productive_time, not_productive_time)
 
             summary = {
                 "productive_time": productive_time,
@@ -239,18 +270,43 @@ async def stop_monitoring(session_id: str):
                 "nudges_received": len(nudges)
             }
 
-        # Run analysis
-        analyzer = SessionAnalyzer()
-        result = analyzer.analyze_and_end_session(session_id)
+        # Mark as analyzing and stop the monitor loop; the session becomes
+        # "completed" once the background analysis ends it
+        db.set_session_status(session_id, "analyzing")
+        if monitor:
+            monitor.stop()
+        # The monitor removes itself from active_monitors once its loop exits
+        background_tasks.add_task(run_session_analysis, analyzer, session_id, monitor)
 
-        # Clean up monitor
-        if session_id in active_monitors:
-            del active_monitors[session_id]
+        return {
+            "status": "accepted",
+            "session_id": session_id,
+            "summary": summary
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/sessions/batch-analyze")
+def batch_analyze_sessions(data: BatchAnalyzeRequest, background_tasks: BackgroundTasks, db: Database = Depends(get_db), analyzer: SessionAnalyzer = Depends(get_analyzer)):
+    """Analyze and end several sessions through the Message Batches API (non-interactive)"""
+    try:
+        for session_id in data.session_ids:
+            if not db.check_session_active(session_id):
+                raise HTTPException(status_code=400, detail=f"Session {session_id} is not active")
+            if session_id in active_monitors:
+                raise HTTPException(status_code=400, detail=f"Session {session_id} is still being monitored")
+
+        # Mark as analyzing so monitoring can't restart or stop these mid-batch
+        for session_id in data.session_ids:
+            db.set_session_status(session_id, "analyzing")
+        background_tasks.add_task(run_batch_analysis, analyzer, data.session_ids)
 
         return {
-            "status": "success",
-            "message": "Session ended and analyzed",
-            "session": result
+            "status": "accepted",
+            "message": "Batch analysis submitted",
+            "session_ids": data.session_ids
         }
     except HTTPException:
         raise
@@ -258,7 +314,7 @@ async def stop_monitoring(session_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/sessions/active/current")
-def get_current_active_session():
+def get_current_active_session(db: Database = Depends(get_db)):
     """Get currently active session if any"""
     try:
         sessions = db.get_all_sessions(limit=1)
@@ -277,11 +333,11 @@ def get_current_active_session():
 # ============= INTERVAL ENDPOINTS =============
 
 @app.post("/api/intervals")
-def add_interval(interval: IntervalCreate):
+def add_interval(interval: IntervalCreate, db: Database = Depends(get_db)):
     """Add a focus/distracted interval"""
     try:
-        time_started = datetime.fromisoformat(interval.time_started)
-        time_ended = datetime.fromisoformat(interval.time_ended)
+        time_started = metrics.parse_ts(interval.time_started)
+        time_ended = metrics.parse_ts(interval.time_ended)
 
         db.add_interval(
             session_id=interval.session_id,
@@ -295,7 +351,7 @@ def add_interval(interval: IntervalCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/sessions/{session_id}/intervals")
-def get_session_intervals(session_id: str):
+def get_session_intervals(session_id: str, db: Database = Depends(get_db)):
     """Get all intervals for a session"""
     try:
         intervals = db.get_session_intervals(session_id)
@@ -306,7 +362,7 @@ def get_session_intervals(session_id: str):
 # ============= NUDGE ENDPOINTS =============
 
 @app.post("/api/nudges")
-def add_nudge(nudge: NudgeCreate):
+def add_nudge(nudge: NudgeCreate, db: Database = Depends(get_db)):
     """Add a nudge event"""
     try:
         db.add_nudge(session_id=nudge.session_id, reason=nudge.reason)
@@ -315,7 +371,7 @@ def add_nudge(nudge: NudgeCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/sessions/{session_id}/nudges")
-def get_session_nudges(session_id: str):
+def get_session_nudges(session_id: str, db: Database = Depends(get_db)):
     """Get all nudges for a session"""
     try:
         nudges = db.get_session_nudges(session_id)
@@ -324,7 +380,7 @@ def get_session_nudges(session_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/sessions/{session_id}/analyses")
-def get_session_analyses(session_id: str):
+def get_session_analyses(session_id: str, db: Database = Depends(get_db)):
     """Get all screenshot analyses for a session (source of truth for timeline)"""
     try:
         analyses = db.get_screenshot_analyses(session_id)
@@ -333,43 +389,24 @@ def get_session_analyses(session_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/sessions/{session_id}/live-stats")
-def get_live_session_stats(session_id: str):
+def get_live_session_stats(session_id: str, db: Database = Depends(get_db)):
     """Get real-time stats for an active session based on screenshot analyses"""
     try:
-        analyses = db.get_screenshot_analyses(session_id)
+        # For the last analysis, count time since that analysis,
+        # capped at a reasonable max (2 minutes) in case monitor stopped
+        durations = db.get_session_duration_summary(session_id, last_duration=120, until=datetime.now())
         nudges = db.get_session_nudges(session_id)
 
-        productive_time = 0
-        not_productive_time = 0
-
-        if analyses:
-            for i, analysis in enumerate(analyses):
-                # Calculate duration: time until next screenshot, or estimate for last one
-                if i < len(analyses) - 1:
-                    current_time = datetime.fromisoformat(analysis["timestamp"])
-                    next_time = datetime.fromisoformat(analyses[i + 1]["timestamp"])
-                    duration = int((next_time - current_time).total_seconds())
-                else:
-                    # For the last analysis, calculate time since that analysis
-                    last_time = datetime.fromisoformat(analysis["timestamp"])
-                    duration = int((datetime.now() - last_time).total_seconds())
-                    # Cap at reasonable max (2 minutes) in case monitor stopped
-                    duration = min(duration, 120)
-
-                if analysis["focused"]:
-                    productive_time += duration
-                else:
-                    not_productive_time += duration
-
-        total_time = productive_time + not_productive_time
-        focus_percentage = (productive_time / total_time * 100) if total_time > 0 else 0
+        productive_time = durations["productive_time"]
+        not_productive_time = durations["not_productive_time"]
+        focus_percentage = metrics.focus_percentage(productive_time, not_productive_time)
 
         return {
             "productive_time": productive_time,
             "not_productive_time": not_productive_time,
             "focus_percentage": focus_percentage,
             "nudges_received": len(nudges),
-            "analyses_count": len(analyses)
+            "analyses_count": durations["analyses_count"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -4,130 +4,339 @@ Uses SQLite with proper schema for users, sessions, intervals, and nudges
 """
 
 import sqlite3
+import queue
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
 from datetime import datetime
-from typing import Optional, List, Dict
-import json
+from typing import Optional, List, Dict, Iterator, Tuple
+import orjson
+
+# Bind datetimes straight through the C isoformat; same text as the default
+# adapter (which is deprecated since Python 3.12) without the Python wrapper
+sqlite3.register_adapter(datetime, partial(datetime.isoformat, sep=" "))
+
+# Hot-path statements, kept as module constants so every call hands sqlite3's
+# per-connection statement cache the same string and reuses the compiled statement.
+# sqlite3 can't prepare with SQLITE_PREPARE_PERSISTENT, so the monitor's statements
+# instead run on its long-lived session_writer connection, where they compile once
+# per session and stay cached
+_SQL_GET_SESSION = "SELECT * FROM sessions WHERE id = ?"
+_SQL_CHECK_SESSION_ACTIVE = "SELECT status FROM sessions WHERE id = ?"
+_SQL_SET_SESSION_STATUS = "UPDATE sessions SET status = ? WHERE id = ?"
+_SQL_ADD_INTERVAL = """
+    INSERT INTO intervals (
+        session_id, interval_time_started, interval_time_ended, focused
+    ) VALUES (?, ?, ?, ?)
+"""
+_SQL_ADD_NUDGE = """
+    INSERT INTO nudges (session_id, nudge_timestamp, nudge_reason)
+    VALUES (?, ?, ?)
+"""
+_SQL_ADD_SCREENSHOT_ANALYSIS = """
+    INSERT INTO screenshot_analyses (session_id, timestamp, focused, explanation)
+    VALUES (?, ?, ?, ?)
+"""
+
+# Aggregate all of a user's completed sessions in one statement
+_SQL_UPDATE_USER_STATS = """
+    UPDATE users
+    SET average_focus_score = agg.avg_focus,
+        total_focus_time = agg.total_time,
+        sessions_completed = agg.total_sessions
+    FROM (
+        SELECT
+            COALESCE(AVG(focus_percentage), 0) AS avg_focus,
+            COALESCE(SUM(productive_time), 0) AS total_time,
+            COUNT(*) AS total_sessions
+        FROM sessions
+        WHERE user_id = :user_id AND status = 'completed'
+    ) AS agg
+    WHERE users.id = :user_id
+"""
+
+_ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ulid_lock = threading.Lock()
+_last_ulid = (0, 0)
+
+
+def new_session_id() -> str:
+    """
+    Generate a ULID session ID (48-bit millisecond time + 80 random bits, Crockford base32)
+    IDs sort by creation time, so new sessions append to the end of the primary key index
+    """
+    global _last_ulid
+    with _ulid_lock:
+        ms = time.time_ns() // 1_000_000
+        last_ms, last_rand = _last_ulid
+        if ms <= last_ms:
+            # Stay monotonic within the same millisecond
+            ms, rand = last_ms, last_rand + 1
+        else:
+            rand = int.from_bytes(os.urandom(10), "big")
+        _last_ulid = (ms, rand)
+
+    value = (ms << 80) | (rand & ((1 << 80) - 1))
+    return "".join(_ULID_ALPHABET[(value >> shift) & 31] for shift in range(125, -1, -5))
 
 
 class Database:
+    # Shared instances per database path, and paths whose schema is already set up
+    _instances: Dict[str, "Database"] = {}
+    _initialized: set = set()
+    _lock = threading.Lock()
+    _schema_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls, db_path: str = "focus_tracker.db") -> "Database":
+        """Get the process-wide Database for a path, so every caller shares one pool"""
+        key = os.path.abspath(db_path)
+        with cls._lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(db_path)
+            return cls._instances[key]
+
     def __init__(self, db_path: str = "focus_tracker.db"):
         self.db_path = db_path
-        self.init_db()
-
-    def get_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
+        # Reused connections skip the connect and pragma setup on every call
+        self._pool = queue.LifoQueue(maxsize=8)
+
+        self._ensure_schema_once()
+
+    def _ensure_schema_once(self):
+        """Run init_db the first time a database path is opened in this process"""
+        key = os.path.abspath(self.db_path)
+        with Database._schema_lock:
+            if key in Database._initialized:
+                return
+            self.init_db()
+            Database._initialized.add(key)
+
+    @contextmanager
+    def get_connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a pooled database connection, opening a new one if the pool is empty
+        Connections run in autocommit mode and are only used by one caller at a time
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def session_writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        Open a dedicated connection for a monitor to hold for its whole session
+        Pass it as conn= to the write methods; it is optimized and closed on release
+        """
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            finally:
+                conn.close()
+
+    @contextmanager
+    def _use(self, conn: Optional[sqlite3.Connection]) -> Iterator[sqlite3.Connection]:
+        """Use the caller's connection when given, otherwise borrow one from the pool"""
+        if conn is not None:
+            yield conn
+        else:
+            with self.get_connection() as pooled:
+                yield pooled
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open and configure a new autocommit connection"""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256
+        )
         conn.row_factory = sqlite3.Row
+        self._configure(conn)
         return conn
 
+    def optimize(self):
+        """Refresh query planner statistics (cheap, usually a no-op)"""
+        with self.get_connection() as conn:
+            conn.execute("PRAGMA optimize")
+
+    def checkpoint(self):
+        """Checkpoint the WAL into the database file and truncate it"""
+        with self.get_connection() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        """Optimize and close all pooled connections"""
+        self.optimize()
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _configure(self, conn: sqlite3.Connection):
+        """Apply per-connection settings (unlike journal_mode, these do not persist in the file)"""
+        conn.executescript("""
+            PRAGMA busy_timeout=5000;
+            PRAGMA foreign_keys=ON;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA mmap_size=268435456;
+            PRAGMA cache_size=-65536;
+            PRAGMA journal_size_limit=67108864;
+            PRAGMA wal_autocheckpoint=1000;
+        """)
+
     def init_db(self):
         """Initialize database with all tables"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                average_focus_score REAL DEFAULT 0.0,
-                total_focus_time INTEGER DEFAULT 0,
-                sessions_completed INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        # Sessions table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                id TEXT PRIMARY KEY,
-                user_id INTEGER DEFAULT 1,
-                title TEXT,
-                goal TEXT NOT NULL,
-                time_started TIMESTAMP NOT NULL,
-                time_ended TIMESTAMP,
-                date TEXT NOT NULL,
-                focus_percentage REAL DEFAULT 0.0,
-                productive_time INTEGER DEFAULT 0,
-                not_productive_time INTEGER DEFAULT 0,
-                nudges_received INTEGER DEFAULT 0,
-                ai_analysis TEXT,
-                ai_structured_output TEXT,
-                status TEXT DEFAULT 'active',
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        """)
+            # WAL lets the analyzer read while the monitor writes; it persists in the file,
+            # so setting it once here covers every later connection
+            cursor.execute("PRAGMA journal_mode=WAL")
 
-        # Intervals table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS intervals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                interval_time_started TIMESTAMP NOT NULL,
-                interval_time_ended TIMESTAMP NOT NULL,
-                focused BOOLEAN NOT NULL,
-                FOREIGN KEY (session_id) REFERENCES sessions(id)
-            )
-        """)
+            # Users table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    average_focus_score REAL DEFAULT 0.0,
+                    total_focus_time INTEGER DEFAULT 0,
+                    sessions_completed INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Sessions table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    user_id INTEGER DEFAULT 1,
+                    title TEXT,
+                    goal TEXT NOT NULL,
+                    time_started TIMESTAMP NOT NULL,
+                    time_ended TIMESTAMP,
+                    date TEXT NOT NULL,
+                    focus_percentage REAL DEFAULT 0.0,
+                    productive_time INTEGER DEFAULT 0,
+                    not_productive_time INTEGER DEFAULT 0,
+                    nudges_received INTEGER DEFAULT 0,
+                    ai_analysis TEXT,
+                    ai_structured_output TEXT,
+                    status TEXT DEFAULT 'active',
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            """)
+
+            # Intervals table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS intervals (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    interval_time_started TIMESTAMP NOT NULL,
+                    interval_time_ended TIMESTAMP NOT NULL,
+                    focused BOOLEAN NOT NULL,
+                    FOREIGN KEY (session_id) REFERENCES sessions(id)
+                )
+            """)
+
+            # Nudges table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS nudges (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    nudge_timestamp TIMESTAMP NOT NULL,
+                    nudge_reason TEXT,
+                    FOREIGN KEY (session_id) REFERENCES sessions(id)
+                )
+            """)
+
+            # Screenshot analyses table (temporary storage for analysis)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS screenshot_analyses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    timestamp TIMESTAMP NOT NULL,
+                    focused BOOLEAN NOT NULL,
+                    explanation TEXT NOT NULL,
+                    FOREIGN KEY (session_id) REFERENCES sessions(id)
+                )
+            """)
+
+            # Covers the per-session timeline scan used for duration aggregates
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_screenshots_session_ts
+                ON screenshot_analyses(session_id, timestamp, focused)
+            """)
 
-        # Nudges table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS nudges (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                nudge_timestamp TIMESTAMP NOT NULL,
-                nudge_reason TEXT,
-                FOREIGN KEY (session_id) REFERENCES sessions(id)
-            )
-        """)
+            # Per-user session listing and the completed-session aggregate
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sessions_user_started
+                ON sessions(user_id, time_started DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sessions_user_status
+                ON sessions(user_id, status)
+            """)
 
-        # Screenshot analyses table (temporary storage for analysis)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS screenshot_analyses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                timestamp TIMESTAMP NOT NULL,
-                focused BOOLEAN NOT NULL,
-                explanation TEXT NOT NULL,
-                FOREIGN KEY (session_id) REFERENCES sessions(id)
-            )
-        """)
+            # Per-session interval and nudge lookups in time order
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_intervals_session_time
+                ON intervals(session_id, interval_time_started)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_nudges_session_ts
+                ON nudges(session_id, nudge_timestamp)
+            """)
 
-        conn.commit()
-        conn.close()
 
         # Create default user if not exists
         self._ensure_default_user()
 
     def _ensure_default_user(self):
         """Ensure default user exists"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT id FROM users WHERE id = 1")
-        if not cursor.fetchone():
-            cursor.execute("INSERT INTO users (id) VALUES (1)")
-            conn.commit()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        conn.close()
+            cursor.execute("INSERT OR IGNORE INTO users (id) VALUES (1)")
 
     # ============= USER METHODS =============
 
     def get_user_stats(self, user_id: int = 1) -> Dict:
         """Get user statistics"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            SELECT
-                average_focus_score,
-                total_focus_time,
-                sessions_completed
-            FROM users
-            WHERE id = ?
-        """, (user_id,))
+            cursor.execute("""
+                SELECT
+                    average_focus_score,
+                    total_focus_time,
+                    sessions_completed
+                FROM users
+                WHERE id = ?
+            """, (user_id,))
 
-        row = cursor.fetchone()
-        conn.close()
+            row = cursor.fetchone()
 
         if row:
             return {
@@ -139,78 +348,100 @@ class Database:
 
     def update_user_stats(self, user_id: int = 1):
         """Recalculate and update user statistics based on all sessions"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Get all completed sessions
-        cursor.execute("""
-            SELECT
-                focus_percentage,
-                productive_time
-            FROM sessions
-            WHERE user_id = ? AND status = 'completed'
-        """, (user_id,))
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        sessions = cursor.fetchall()
-
-        if sessions:
-            total_sessions = len(sessions)
-            avg_focus = sum(s["focus_percentage"] for s in sessions) / total_sessions
-            total_time = sum(s["productive_time"] for s in sessions)
-
-            cursor.execute("""
-                UPDATE users
-                SET average_focus_score = ?,
-                    total_focus_time = ?,
-                    sessions_completed = ?
-                WHERE id = ?
-            """, (avg_focus, total_time, total_sessions, user_id))
-
-            conn.commit()
-
-        conn.close()
+            cursor.execute(_SQL_UPDATE_USER_STATS, {"user_id": user_id})
 
     # ============= SESSION METHODS =============
 
     def create_session(self, session_id: str, goal: str, user_id: int = 1) -> Dict:
         """Create a new session"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        now = datetime.now()
-        date = now.strftime("%Y-%m-%d")
-
-        cursor.execute("""
-            INSERT INTO sessions (
-                id, user_id, goal, time_started, date, status
-            ) VALUES (?, ?, ?, ?, ?, 'active')
-        """, (session_id, user_id, goal, now, date))
+            # date is the day prefix of the stored time_started, derived in SQL
+            cursor.execute("""
+                INSERT INTO sessions (
+                    id, user_id, goal, time_started, date, status
+                ) VALUES (?1, ?2, ?3, ?4, substr(?4, 1, 10), 'active')
+                RETURNING time_started, status
+            """, (session_id, user_id, goal, datetime.now()))
 
-        conn.commit()
-        conn.close()
+            row = cursor.fetchone()
 
         return {
             "session_id": session_id,
             "goal": goal,
-            "time_started": now.isoformat(),
-            "status": "active"
+            "time_started": row["time_started"],
+            "status": row["status"]
         }
 
     def get_session(self, session_id: str) -> Optional[Dict]:
         """Get session by ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute(_SQL_GET_SESSION, (session_id,))
+
+            row = cursor.fetchone()
+
+        if not row:
+            return None
+
+        return self._session_from_row(row)
 
-        cursor.execute("""
-            SELECT * FROM sessions WHERE id = ?
-        """, (session_id,))
+    def get_session_bundle(self, session_id: str) -> Optional[Dict]:
+        """Get a session with its intervals and nudges in a single query"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        row = cursor.fetchone()
-        conn.close()
+            cursor.execute("""
+                SELECT
+                    s.*,
+                    (
+                        SELECT json_group_array(json_object(
+                            'id', i.id,
+                            'interval_time_started', i.interval_time_started,
+                            'interval_time_ended', i.interval_time_ended,
+                            'focused', i.focused
+                        ))
+                        FROM (
+                            SELECT * FROM intervals
+                            WHERE session_id = s.id
+                            ORDER BY interval_time_started ASC
+                        ) AS i
+                    ) AS intervals_json,
+                    (
+                        SELECT json_group_array(json_object(
+                            'id', n.id,
+                            'timestamp', n.nudge_timestamp,
+                            'reason', n.nudge_reason
+                        ))
+                        FROM (
+                            SELECT * FROM nudges
+                            WHERE session_id = s.id
+                            ORDER BY nudge_timestamp ASC
+                        ) AS n
+                    ) AS nudges_json
+                FROM sessions s
+                WHERE s.id = ?
+            """, (session_id,))
+
+            row = cursor.fetchone()
 
         if not row:
             return None
 
+        return {
+            "session": self._session_from_row(row),
+            "intervals": orjson.loads(row["intervals_json"]),
+            "nudges": orjson.loads(row["nudges_json"])
+        }
+
+    @staticmethod
+    def _session_from_row(row: sqlite3.Row) -> Dict:
+        """Build a session dict from a sessions row"""
         return {
             "id": row["id"],
             "title": row["title"],
@@ -223,42 +454,32 @@ class Database:
             "not_productive_time": row["not_productive_time"],
             "nudges_received": row["nudges_received"],
             "ai_analysis": row["ai_analysis"],
-            "ai_structured_output": json.loads(row["ai_structured_output"]) if row["ai_structured_output"] else None,
+            "ai_structured_output": orjson.loads(row["ai_structured_output"]) if row["ai_structured_output"] else None,
             "status": row["status"]
         }
 
     def get_all_sessions(self, user_id: int = 1, limit: int = 50) -> List[Dict]:
         """Get all sessions for a user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT * FROM sessions
-            WHERE user_id = ?
-            ORDER BY time_started DESC
-            LIMIT ?
-        """, (user_id, limit))
-
-        rows = cursor.fetchall()
-        conn.close()
-
-        sessions = []
-        for row in rows:
-            sessions.append({
-                "id": row["id"],
-                "title": row["title"],
-                "goal": row["goal"],
-                "time_started": row["time_started"],
-                "time_ended": row["time_ended"],
-                "date": row["date"],
-                "focus_percentage": row["focus_percentage"],
-                "productive_time": row["productive_time"],
-                "not_productive_time": row["not_productive_time"],
-                "nudges_received": row["nudges_received"],
-                "status": row["status"]
-            })
-
-        return sessions
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Per-session counts come from indexed subqueries in the same scan
+            cursor.execute("""
+                SELECT
+                    s.id, s.title, s.goal, s.time_started, s.time_ended, s.date,
+                    s.focus_percentage, s.productive_time, s.not_productive_time,
+                    s.nudges_received, s.status,
+                    (SELECT COUNT(*) FROM intervals i WHERE i.session_id = s.id AND i.focused = 1) AS focused_count,
+                    (SELECT COUNT(*) FROM nudges n WHERE n.session_id = s.id) AS nudge_count
+                FROM sessions s
+                WHERE user_id = ?
+                ORDER BY time_started DESC
+                LIMIT ?
+            """, (user_id, limit))
+
+            rows = cursor.fetchall()
+
+        return [dict(row) for row in rows]
 
     def end_session(
         self,
@@ -272,53 +493,74 @@ class Database:
         ai_structured_output: Dict
     ):
         """End a session and save final statistics"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            UPDATE sessions
-            SET time_ended = ?,
-                title = ?,
-                focus_percentage = ?,
-                productive_time = ?,
-                not_productive_time = ?,
-                nudges_received = ?,
-                ai_analysis = ?,
-                ai_structured_output = ?,
-                status = 'completed'
-            WHERE id = ?
-        """, (
-            datetime.now(),
-            title,
-            focus_percentage,
-            productive_time,
-            not_productive_time,
-            nudges_received,
-            ai_analysis,
-            json.dumps(ai_structured_output),
-            session_id
-        ))
-
-        conn.commit()
-        conn.close()
-
-        # Update user stats
-        self.update_user_stats()
-
-    def check_session_active(self, session_id: str) -> bool:
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            # The session and its user's stats are updated in one transaction
+            cursor.execute("BEGIN IMMEDIATE")
+
+            cursor.execute("""
+                UPDATE sessions
+                SET time_ended = ?,
+                    title = ?,
+                    focus_percentage = ?,
+                    productive_time = ?,
+                    not_productive_time = ?,
+                    nudges_received = ?,
+                    ai_analysis = ?,
+                    ai_structured_output = ?,
+                    status = 'completed'
+                WHERE id = ?
+                RETURNING user_id
+            """, (
+                datetime.now(),
+                title,
+                focus_percentage,
+                productive_time,
+                not_productive_time,
+                nudges_received,
+                ai_analysis,
+                orjson.dumps(ai_structured_output).decode(),
+                session_id
+            ))
+
+            row = cursor.fetchone()
+            if row:
+                cursor.execute(_SQL_UPDATE_USER_STATS, {"user_id": row["user_id"]})
+
+            cursor.execute("COMMIT")
+
+        # The session's monitor has stopped, so this is a quiet moment to checkpoint
+        self.checkpoint()
+        self.optimize()
+
+    def check_session_active(self, session_id: str, conn: Optional[sqlite3.Connection] = None) -> bool:
         """Check if session is active"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self._use(conn) as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            SELECT status FROM sessions WHERE id = ?
-        """, (session_id,))
+            cursor.execute(_SQL_CHECK_SESSION_ACTIVE, (session_id,))
 
-        row = cursor.fetchone()
-        conn.close()
+            row = cursor.fetchone()
 
         return row and row["status"] == "active"
 
+    def set_session_status(self, session_id: str, status: str):
+        """Set a session's status"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute(_SQL_SET_SESSION_STATUS, (status, session_id))
+
+    def reset_analyzing_sessions(self) -> int:
+        """Return sessions stuck in 'analyzing' to 'active' so they can be ended again"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute("UPDATE sessions SET status = 'active' WHERE status = 'analyzing'")
+
+            return cursor.rowcount
+
     # ============= INTERVAL METHODS =============
 
     def add_interval(
@@ -329,73 +571,70 @@ class Database:
         focused: bool
     ):
         """Add a focus/distracted interval"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            INSERT INTO intervals (
-                session_id, interval_time_started, interval_time_ended, focused
-            ) VALUES (?, ?, ?, ?)
-        """, (session_id, time_started, time_ended, focused))
+            cursor.execute(_SQL_ADD_INTERVAL, (session_id, time_started, time_ended, focused))
 
-        conn.commit()
-        conn.close()
+    def add_intervals_bulk(
+        self,
+        session_id: str,
+        rows: List[Tuple[datetime, datetime, bool]],
+        conn: Optional[sqlite3.Connection] = None
+    ):
+        """Add (time_started, time_ended, focused) intervals in a single transaction"""
+        with self._use(conn) as conn:
+            try:
+                conn.execute("BEGIN")
+                conn.executemany(_SQL_ADD_INTERVAL, [(session_id, *row) for row in rows])
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                # A caller's connection isn't reset for it, so never leave it mid-transaction
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
 
     def get_session_intervals(self, session_id: str) -> List[Dict]:
         """Get all intervals for a session"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            SELECT * FROM intervals
-            WHERE session_id = ?
-            ORDER BY interval_time_started ASC
-        """, (session_id,))
+            cursor.execute("""
+                SELECT id, interval_time_started, interval_time_ended, focused
+                FROM intervals
+                WHERE session_id = ?
+                ORDER BY interval_time_started ASC
+            """, (session_id,))
 
-        rows = cursor.fetchall()
-        conn.close()
+            rows = cursor.fetchall()
 
-        return [{
-            "id": row["id"],
-            "interval_time_started": row["interval_time_started"],
-            "interval_time_ended": row["interval_time_ended"],
-            "focused": bool(row["focused"])
-        } for row in rows]
+        # focused stays the stored 0/1; callers only test its truthiness
+        return [dict(row) for row in rows]
 
     # ============= NUDGE METHODS =============
 
-    def add_nudge(self, session_id: str, reason: str):
+    def add_nudge(self, session_id: str, reason: str, conn: Optional[sqlite3.Connection] = None):
         """Add a nudge event"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self._use(conn) as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            INSERT INTO nudges (session_id, nudge_timestamp, nudge_reason)
-            VALUES (?, ?, ?)
-        """, (session_id, datetime.now(), reason))
-
-        conn.commit()
-        conn.close()
+            cursor.execute(_SQL_ADD_NUDGE, (session_id, datetime.now(), reason))
 
     def get_session_nudges(self, session_id: str) -> List[Dict]:
         """Get all nudges for a session"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            SELECT * FROM nudges
-            WHERE session_id = ?
-            ORDER BY nudge_timestamp ASC
-        """, (session_id,))
+            cursor.execute("""
+                SELECT id, nudge_timestamp AS timestamp, nudge_reason AS reason
+                FROM nudges
+                WHERE session_id = ?
+                ORDER BY nudge_timestamp ASC
+            """, (session_id,))
 
-        rows = cursor.fetchall()
-        conn.close()
+            rows = cursor.fetchall()
 
-        return [{
-            "id": row["id"],
-            "timestamp": row["nudge_timestamp"],
-            "reason": row["nudge_reason"]
-        } for row in rows]
+        return [dict(row) for row in rows]
 
     # ============= SCREENSHOT ANALYSIS METHODS (TEMPORARY) =============
 
@@ -407,47 +646,96 @@ class Database:
         explanation: str
     ):
         """Add a screenshot analysis to temporary storage"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            INSERT INTO screenshot_analyses (session_id, timestamp, focused, explanation)
-            VALUES (?, ?, ?, ?)
-        """, (session_id, timestamp, focused, explanation))
+            cursor.execute(_SQL_ADD_SCREENSHOT_ANALYSIS, (session_id, timestamp, focused, explanation))
 
-        conn.commit()
-        conn.close()
+    def add_screenshot_analyses_bulk(
+        self,
+        session_id: str,
+        rows: List[Tuple[datetime, bool, str]],
+        conn: Optional[sqlite3.Connection] = None
+    ):
+        """Add (timestamp, focused, explanation) screenshot analyses in a single transaction"""
+        with self._use(conn) as conn:
+            try:
+                conn.execute("BEGIN")
+                conn.executemany(_SQL_ADD_SCREENSHOT_ANALYSIS, [(session_id, *row) for row in rows])
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                # A caller's connection isn't reset for it, so never leave it mid-transaction
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
 
     def get_screenshot_analyses(self, session_id: str) -> List[Dict]:
         """Get all screenshot analyses for a session"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            SELECT * FROM screenshot_analyses
-            WHERE session_id = ?
-            ORDER BY timestamp ASC
-        """, (session_id,))
+            cursor.execute("""
+                SELECT id, timestamp, focused, explanation
+                FROM screenshot_analyses
+                WHERE session_id = ?
+                ORDER BY timestamp ASC
+            """, (session_id,))
 
-        rows = cursor.fetchall()
-        conn.close()
+            rows = cursor.fetchall()
 
-        return [{
-            "id": row["id"],
-            "timestamp": row["timestamp"],
-            "focused": bool(row["focused"]),
-            "explanation": row["explanation"]
-        } for row in rows]
+        # focused stays the stored 0/1; callers only test its truthiness
+        return [dict(row) for row in rows]
+
+    def get_session_duration_summary(
+        self,
+        session_id: str,
+        last_duration: int = 30,
+        until: Optional[datetime] = None
+    ) -> Dict:
+        """
+        Aggregate productive/not productive seconds from screenshot analyses in SQL
+        Each screenshot lasts until the next one; the last lasts last_duration seconds,
+        or the time until `until` capped at last_duration when `until` is given
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute("""
+                SELECT
+                    COALESCE(SUM(CASE WHEN focused THEN duration ELSE 0 END), 0) AS productive_time,
+                    COALESCE(SUM(CASE WHEN focused THEN 0 ELSE duration END), 0) AS not_productive_time,
+                    COUNT(*) AS analyses_count,
+                    COALESCE(SUM(focused), 0) AS focused_count
+                FROM (
+                    SELECT
+                        focused,
+                        COALESCE(
+                            CAST(ROUND((julianday(LEAD(timestamp) OVER (ORDER BY timestamp)) - julianday(timestamp)) * 86400000) AS INTEGER) / 1000,
+                            CASE
+                                WHEN :until IS NULL THEN :last_duration
+                                ELSE MIN(CAST(ROUND((julianday(:until) - julianday(timestamp)) * 86400000) AS INTEGER) / 1000, :last_duration)
+                            END
+                        ) AS duration
+                    FROM screenshot_analyses
+                    WHERE session_id = :session_id
+                )
+            """, {"session_id": session_id, "last_duration": last_duration, "until": until})
+
+            row = cursor.fetchone()
+
+        return {
+            "productive_time": row["productive_time"],
+            "not_productive_time": row["not_productive_time"],
+            "analyses_count": row["analyses_count"],
+            "focused_count": row["focused_count"]
+        }
 
     def delete_screenshot_analyses(self, session_id: str):
         """Delete all screenshot analyses for a session (cleanup after analysis)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            DELETE FROM screenshot_analyses
-            WHERE session_id = ?
-        """, (session_id,))
-
-        conn.commit()
-        conn.close()
+            cursor.execute("""
+                DELETE FROM screenshot_analyses
+                WHERE session_id = ?
+            """, (session_id,))
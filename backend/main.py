@@ -6,11 +6,11 @@ Orchestrates session creation, monitoring, and analysis
 
 import sys
 import os
+import asyncio
 from datetime import datetime
-from database import Database
-from monitor import FocusMonitor
-from analysis import SessionAnalyzer
-import uuid
+from dotenv import load_dotenv
+
+from database import Database, new_session_id
 
 
 def print_banner():
@@ -30,8 +30,8 @@ def create_new_session():
         return None
 
     # Create session in database
-    db = Database()
-    session_id = str(uuid.uuid4())
+    db = Database.instance()
+    session_id = new_session_id()
     session = db.create_session(session_id, goal)
 
     print(f"\n✅ Session created!")
@@ -48,18 +48,24 @@ def run_monitoring(session_id: str, goal: str):
     print("   Press Ctrl+C to end session\n")
 
     import time
+    # Imported here so the SDKs only load once a session is actually starting
+    from monitor import FocusMonitor
     time.sleep(3)
 
     monitor = FocusMonitor(session_id, goal, screenshot_interval=30)
-    monitor.monitor_loop()
+    asyncio.run(monitor.monitor_loop())
 
 
 def analyze_session(session_id: str):
     """Generate AI analysis for the session"""
     print(f"\n🤖 Analyzing session with AI...")
 
+    from analysis import SessionAnalyzer
     analyzer = SessionAnalyzer()
-    session = analyzer.analyze_and_end_session(session_id)
+    try:
+        session = asyncio.run(analyzer.analyze_and_end_session(session_id))
+    finally:
+        analyzer.db.close()
 
     print("\n" + "="*60)
     print("SESSION SUMMARY")
@@ -90,7 +96,8 @@ def main():
     """Main CLI flow"""
     print_banner()
 
-    # Check for required API key
+    # Load .env, then check for the required API key
+    load_dotenv()
     if not os.getenv("ANTHROPIC_API_KEY"):
         print("\n❌ Error: ANTHROPIC_API_KEY not found!")
         print("   Set it in your .env file or environment")
@@ -0,0 +1,28 @@
+"""
+Focus metrics
+Timestamp parsing and focus-percentage helpers over screenshot analyses, shared by the API and analyzer
+"""
+
+import numpy as np
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List
+
+# The same timestamp strings are parsed repeatedly across the end-session path
+parse_ts = lru_cache(maxsize=4096)(datetime.fromisoformat)
+
+
+def parse_timestamps(analyses: List[Dict]) -> np.ndarray:
+    """Parse analysis timestamps into a datetime64[us] array"""
+    return np.array([a["timestamp"] for a in analyses], dtype="datetime64[us]")
+
+
+def focused_mask(analyses: List[Dict]) -> np.ndarray:
+    """Boolean array of each analysis' focused flag"""
+    return np.fromiter((a["focused"] for a in analyses), dtype=bool, count=len(analyses))
+
+
+def focus_percentage(productive_time: int, not_productive_time: int) -> float:
+    """Share of tracked time spent focused, as a percentage"""
+    total_time = productive_time + not_productive_time
+    return (productive_time / total_time * 100) if total_time > 0 else 0
@@ -3,75 +3,78 @@ Screenshot monitoring service
 Captures screenshots, analyzes with Qwen (local) + Claude (API), tracks intervals, sends nudges
 """
 
+import asyncio
+import io
 import time
 import os
+import signal
+import sqlite3
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from PIL import ImageGrab
+from typing import Optional, Tuple
+import httpx
+import mss
+from PIL import Image
 import ollama
 import anthropic
 from dotenv import load_dotenv
 
+try:
+    # macOS-only (pyobjc); without it every frame goes through the vision model
+    import Quartz
+except ImportError:
+    Quartz = None
+
+try:
+    # macOS-only (pyobjc); without it nudges fall back to osascript
+    from Foundation import NSUserNotification, NSUserNotificationCenter
+except ImportError:
+    NSUserNotification = NSUserNotificationCenter = None
+
+import metrics
 from database import Database
 
 load_dotenv()
 
+# Interval and screenshot rows are buffered and written in one transaction once
+# this many are pending, this many seconds have passed since the last write,
+# or the focus state changes
+FLUSH_MAX_ROWS = 10
+FLUSH_MAX_SECONDS = 120
 
-class FocusMonitor:
-    """Monitor user focus by analyzing screenshots"""
-
-    def __init__(self, session_id: str, goal: str, screenshot_interval: int = 0):
-        self.session_id = session_id
-        self.goal = goal
-        self.screenshot_interval = screenshot_interval
-        self.db = Database()
-        self.anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+# Seconds between PRAGMA optimize runs during long sessions
+OPTIMIZE_INTERVAL = 3600
 
-        # Session tracking
-        self.consecutive_distractions = 0
-        self.nudges_sent = 0
-        self.current_interval_start = None
-        self.current_interval_focused = None
+# stop() ends the loop directly; the session status is still polled this often
+# in case the session was ended from another process
+ACTIVE_CHECK_INTERVAL = 60
 
-        # Thresholds
-        self.consecutive_distractions_for_nudge = 3
+# Qwen descriptions are reused for frames whose dHash is within this many bits
+# of one of the last DESC_CACHE_SIZE described frames
+DESC_CACHE_SIZE = 16
+DHASH_MAX_DISTANCE = 5
 
-    def capture_screenshot(self) -> str:
-        """Capture screenshot and save to temp file"""
-        screenshot = ImageGrab.grab()
-        path = f"temp_screenshot_{self.session_id}.png"
-        screenshot.save(path, format='PNG')
-        return path
+# Qwen calls allowed at once across every monitor in the process; each monitor runs
+# its own event loop on its own thread, so this has to be a thread-level semaphore
+QWEN_CONCURRENCY = 1
+_QWEN_SLOTS = threading.BoundedSemaphore(QWEN_CONCURRENCY)
+# Blocking acquires run here, off the event loops; the pool's queue hands out slots
+# in the order monitors asked for them
+_QWEN_WAITERS = ThreadPoolExecutor(thread_name_prefix="qwen-slot")
 
-    def analyze_with_qwen(self, screenshot_path: str) -> str:
-        """Use Qwen vision model to describe what's on screen"""
-        try:
-            result = ollama.chat(
-                model='qwen3-vl:2b',
-                messages=[{
-                    'role': 'user',
-                    'content': f"""Describe what you see on this screen in 2-3 sentences.
-Focus on: what application is open, what the user appears to be doing, what window they are primarily on, and any visible text or content.""",
-                    'images': [screenshot_path]
-                }]
-            )
-            return result['message']['content'].strip()
-        except Exception as e:
-            print(f"❌ Qwen error: {e}")
-            return None
+# Longest edge of the image sent to Qwen; the VLM tiles far smaller than native screens
+QWEN_MAX_EDGE = 1280
 
-    def analyze_with_claude(self, description: str) -> tuple:
-        """Use Claude to classify as FOCUSED or DISTRACTED"""
-        try:
-            response = self.anthropic_client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=150,
-                messages=[{
-                    "role": "user",
-                    "content": f"""User's goal: {self.goal}
+# While the frontmost window is unchanged, re-run Qwen + Claude only every this many frames
+# (the frames in between reuse the last verdict)
+VLM_EVERY_FRAMES = 3
 
-Screen description from vision model: {description}
 
-Analyze whether the user is FOCUSED or DISTRACTED based on these principles:
+# Static classification rubric; goes after the goal in the system prompt
+_RUBRIC_HEADER = """Analyze whether the user is FOCUSED or DISTRACTED based on these principles:
 
 FOCUSED includes:
 - Direct work on the stated goal
@@ -97,15 +100,188 @@ Context matters: Consider the RELATIONSHIP between what's on screen and the goal
 - Writer on Twitter reading threads about writing = FOCUSED (research/inspiration)
 - Designer on Pinterest/Dribbble = FOCUSED (gathering inspiration)
 - Student on Wikipedia/YouTube educational content = FOCUSED (learning)
-- Anyone on Reddit in a relevant subreddit = FOCUSED (community research)
+- Anyone on Reddit in a relevant subreddit = FOCUSED (community research)"""
+
+
+def dhash(image) -> int:
+    """64-bit difference hash: each bit is whether a pixel is brighter than its right neighbour"""
+    pixels = list(image.resize((9, 8)).convert("L").getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            bits = (bits << 1) | (left > pixels[row * 9 + col + 1])
+    return bits
+
+
+class FocusMonitor:
+    """Monitor user focus by analyzing screenshots"""
+
+    def __init__(self, session_id: str, goal: str, screenshot_interval: int = 0, db: Optional[Database] = None):
+        self.session_id = session_id
+        self.goal = goal
+        self.screenshot_interval = screenshot_interval
+        self.db = db or Database.instance()
+        # One keep-alive HTTP/2 pool per monitor; closed when monitor_loop exits
+        self.anthropic_client = anthropic.AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                http2=True,
+                timeout=30.0,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)
+            )
+        )
+        self.ollama_client = ollama.AsyncClient()
+        # mss handles belong to the thread that created them, so every grab runs on one thread
+        self._capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+        self._sct = None
+        # dHash -> Qwen description for recent frames, least recently used first
+        self._desc_cache = OrderedDict()
+
+        # Session tracking
+        self.consecutive_distractions = 0
+        self.nudges_sent = 0
+        self.current_interval_start = None
+        self.current_interval_focused = None
+
+        # Pending database writes
+        self.pending_intervals = []
+        self.pending_analyses = []
+        self.last_flush = time.monotonic()
+        self.flush_lock = threading.Lock()
+        # Dedicated connection held while the loop runs (None means use the pool)
+        self.writer = None
+        self.last_optimize = time.monotonic()
+
+        # Set by stop(); _wake interrupts the producer's sleep on the monitor's event loop
+        self._stop = threading.Event()
+        self._wake = asyncio.Event()
+        self._loop = None
+        # Set once monitor_loop has fully finished, including the final flush
+        self.done = threading.Event()
+
+        # Frontmost (owner, title) and verdict of the last frame Claude classified
+        self._last_window = None
+        self._last_verdict = None
+        self._frames_since_vlm = 0
+
+        # Thresholds
+        self.consecutive_distractions_for_nudge = 3
+
+        # Rubric + goal never change during a session, so they go in the system prompt
+        # and only the screen description travels in each request
+        self._system = f"User's goal: {self.goal}\n\n{_RUBRIC_HEADER}"
+
+    def capture_screenshot(self) -> Tuple[Image.Image, int]:
+        """Capture screenshot in memory and return it with its dHash (runs on the capture thread)"""
+        if self._sct is None:
+            self._sct = mss.mss()
+        # monitors[0] is the whole virtual screen; one grab beats one per monitor
+        raw = self._sct.grab(self._sct.monitors[0])
+        screenshot = Image.frombuffer("RGB", raw.size, raw.bgra, "raw", "BGRX")
+        return screenshot, dhash(screenshot)
+
+    def close_capture(self):
+        """Release the mss handle (runs on the capture thread)"""
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+
+    def encode_screenshot(self, screenshot: Image.Image) -> bytes:
+        """Downscale and JPEG-encode a screenshot for the vision model"""
+        screenshot.thumbnail((QWEN_MAX_EDGE, QWEN_MAX_EDGE), Image.Resampling.BILINEAR)
+        buf = io.BytesIO()
+        # optimize=True costs CPU without a meaningful size win at this quality
+        screenshot.save(buf, format="JPEG", quality=80, optimize=False)
+        return buf.getvalue()
+
+    def window_signature(self) -> Optional[Tuple[str, str]]:
+        """(owner, title) of the frontmost window, or None where Quartz is unavailable"""
+        if Quartz is None:
+            return None
+        windows = Quartz.CGWindowListCopyWindowInfo(
+            Quartz.kCGWindowListOptionOnScreenOnly | Quartz.kCGWindowListExcludeDesktopElements,
+            Quartz.kCGNullWindowID
+        )
+        # Windows are listed front to back; layer 0 holds ordinary application windows
+        for window in windows:
+            if window.get(Quartz.kCGWindowLayer) == 0:
+                return window.get(Quartz.kCGWindowOwnerName), window.get(Quartz.kCGWindowName)
+        return None
+
+    def cached_description(self, frame_hash: int) -> Optional[str]:
+        """Description of a recent near-duplicate frame, if any"""
+        for cached_hash, description in self._desc_cache.items():
+            if (cached_hash ^ frame_hash).bit_count() <= DHASH_MAX_DISTANCE:
+                self._desc_cache.move_to_end(cached_hash)
+                return description
+        return None
+
+    def cache_description(self, frame_hash: int, description: str):
+        """Remember a frame's description, evicting the least recently used"""
+        self._desc_cache[frame_hash] = description
+        self._desc_cache.move_to_end(frame_hash)
+        if len(self._desc_cache) > DESC_CACHE_SIZE:
+            self._desc_cache.popitem(last=False)
+
+    async def acquire_qwen_slot(self):
+        """Wait for a process-wide Qwen slot without blocking this monitor's event loop"""
+        acquired = _QWEN_WAITERS.submit(_QWEN_SLOTS.acquire)
+        try:
+            await asyncio.wrap_future(acquired)
+        except asyncio.CancelledError:
+            # A blocked acquire can't be interrupted; give the slot back once it lands
+            acquired.add_done_callback(lambda f: f.cancelled() or _QWEN_SLOTS.release())
+            raise
+
+    async def analyze_with_qwen(self, image_bytes: bytes) -> str:
+        """Use Qwen vision model to describe what's on screen"""
+        try:
+            await self.acquire_qwen_slot()
+            try:
+                result = await self.ollama_client.chat(
+                    model='qwen3-vl:2b',
+                    messages=[{
+                        'role': 'user',
+                        'content': f"""Describe what you see on this screen in 2-3 sentences.
+Focus on: what application is open, what the user appears to be doing, what window they are primarily on, and any visible text or content.""",
+                        'images': [image_bytes]
+                    }]
+                )
+            finally:
+                _QWEN_SLOTS.release()
+            return result['message']['content'].strip()
+        except Exception as e:
+            print(f"❌ Qwen error: {e}")
+            return None
+
+    async def analyze_with_claude(self, description: str) -> tuple:
+        """Use Claude to classify as FOCUSED or DISTRACTED"""
+        try:
+            text = ""
+            async with self.anthropic_client.messages.stream(
+                model="claude-haiku-4-5",
+                max_tokens=40,
+                system=self._system,
+                messages=[{
+                    "role": "user",
+                    "content": f"""Screen description from vision model: {description}
 
 Answer with only: FOCUSED or DISTRACTED
 
 Then on a new line, provide a brief one-sentence explanation of why, referencing specific elements that informed your decision."""
                 }]
-            )
-
-            result = response.content[0].text.strip()
+            ) as stream:
+                async for chunk in stream.text_stream:
+                    text += chunk
+                    # Stop reading once the classification and explanation lines are complete
+                    # (the last piece may be a partial line; blank lines between them are skipped)
+                    lines = [line for line in text.split('\n')[:-1] if line.strip()]
+                    if len(lines) >= 2:
+                        text = '\n'.join(lines[:2])
+                        break
+
+            result = text.strip()
             lines = result.split('\n', 1)
             classification = lines[0].strip().upper()
             explanation = lines[1].strip() if len(lines) > 1 else ""
@@ -118,15 +294,68 @@ Then on a new line, provide a brief one-sentence explanation of why, referencing
 
     def show_notification(self, title: str, message: str):
         """Show macOS notification"""
-        escaped_message = message.replace('"', '\\"')
-        os.system(f'''osascript -e 'display notification "{escaped_message}" with title "{title}"' ''')
+        # The default center is None when Python isn't running from an app bundle
+        center = NSUserNotificationCenter and NSUserNotificationCenter.defaultUserNotificationCenter()
+        if center is not None:
+            notification = NSUserNotification.alloc().init()
+            notification.setTitle_(title)
+            notification.setInformativeText_(message)
+            center.deliverNotification_(notification)
+            return
+
+        # Title and message are passed as arguments, so they need no escaping
+        try:
+            subprocess.Popen([
+                "osascript",
+                "-e", "on run argv",
+                "-e", "display notification (item 2 of argv) with title (item 1 of argv)",
+                "-e", "end run",
+                title, message
+            ])
+        except OSError as e:
+            # No osascript off macOS; a missed notification must not stop monitoring
+            print(f"⚠️  Could not show notification: {e}")
+
+    def add_interval(self, time_started: datetime, time_ended: datetime, focused: bool):
+        """Buffer an interval for the next flush"""
+        with self.flush_lock:
+            self.pending_intervals.append((time_started, time_ended, focused))
+
+    def add_screenshot_analysis(self, timestamp: datetime, focused: bool, explanation: str):
+        """Buffer a screenshot analysis for the next flush"""
+        with self.flush_lock:
+            self.pending_analyses.append((timestamp, focused, explanation))
+
+    def flush(self):
+        """Write buffered intervals and screenshot analyses to the database"""
+        with self.flush_lock:
+            intervals, self.pending_intervals = self.pending_intervals, []
+            analyses, self.pending_analyses = self.pending_analyses, []
+            self.last_flush = time.monotonic()
+
+            try:
+                if intervals:
+                    self.db.add_intervals_bulk(self.session_id, intervals, conn=self.writer)
+                    intervals = []
+                if analyses:
+                    self.db.add_screenshot_analyses_bulk(self.session_id, analyses, conn=self.writer)
+            except sqlite3.Error as e:
+                # Each bulk write rolls back on failure; keep the unwritten rows for the next flush
+                print(f"⚠️  Database write failed, will retry: {e}")
+                self.pending_intervals = intervals + self.pending_intervals
+                self.pending_analyses = analyses + self.pending_analyses
+
+    def maybe_flush(self):
+        """Flush once enough rows are pending or enough time has passed"""
+        pending = len(self.pending_intervals) + len(self.pending_analyses)
+        if pending >= FLUSH_MAX_ROWS or time.monotonic() - self.last_flush >= FLUSH_MAX_SECONDS:
+            self.flush()
 
     def handle_interval_change(self, focused: bool, timestamp: datetime):
         """Handle transition between focus states"""
         if self.current_interval_start is not None:
             # Save the previous interval
-            self.db.add_interval(
-                session_id=self.session_id,
+            self.add_interval(
                 time_started=self.current_interval_start,
                 time_ended=timestamp,
                 focused=self.current_interval_focused
@@ -136,151 +365,281 @@ Then on a new line, provide a brief one-sentence explanation of why, referencing
         self.current_interval_start = timestamp
         self.current_interval_focused = focused
 
-    def monitor_loop(self):
-        """Main monitoring loop"""
-        print(f"\n{'='*60}")
-        print(f"🎯 Monitoring session: {self.goal}")
-        print(f"📸 Taking screenshots every {self.screenshot_interval} seconds")
-        print(f"🔔 Will nudge after {self.consecutive_distractions_for_nudge} consecutive distractions")
-        print(f"{'='*60}\n")
-        print("Press Ctrl+C to stop\n")
+        # Write the finished interval now so readers see the state change promptly
+        self.flush()
 
-        screenshot_path = None
-        start_time = datetime.now()
+    def stop(self):
+        """Ask the monitor to stop (safe from any thread or a signal handler)"""
+        self._stop.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
 
+    async def wait_for_stop(self, timeout: float) -> bool:
+        """Sleep up to timeout seconds, returning early with True once stop() is called"""
         try:
-            time.sleep(10)  # Initial delay before first capture
-            while True:
-                # Check if session is still active
-                if not self.db.check_session_active(self.session_id):
-                    print("\n⚠️  Session ended externally. Stopping monitor.")
-                    break
-
-                timestamp = datetime.now()
-                print(f"[{timestamp.strftime('%H:%M:%S')}] 📸 Capturing screenshot...")
-
-                # Capture screenshot
-                screenshot_path = self.capture_screenshot()
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._stop.is_set()
+
+    def is_session_active(self) -> bool:
+        """Check the session status on the monitor's connection"""
+        with self.flush_lock:
+            return self.db.check_session_active(self.session_id, conn=self.writer)
+
+    def record_classification(self, timestamp: datetime, focused: bool, explanation: str):
+        """Record a classified screenshot: analysis row, interval tracking and nudges"""
+        # Store the screenshot analysis in temporary table
+        self.add_screenshot_analysis(
+            timestamp=timestamp,
+            focused=focused,
+            explanation=explanation
+        )
+
+        # Handle interval tracking
+        if self.current_interval_focused is None:
+            # First check - initialize
+            self.current_interval_start = timestamp
+            self.current_interval_focused = focused
+        elif self.current_interval_focused != focused:
+            # State changed - save old interval and start new one
+            self.handle_interval_change(focused, timestamp)
+
+        # Update consecutive distractions
+        if focused:
+            self.consecutive_distractions = 0
+            print(f"  ✅ FOCUSED: {explanation}")
+        else:
+            self.consecutive_distractions += 1
+            print(f"  ⚠️  DISTRACTED: {explanation}")
+            print(f"  ⚠️  Consecutive: {self.consecutive_distractions}/{self.consecutive_distractions_for_nudge}")
+
+            # Send nudge if threshold reached
+            if self.consecutive_distractions >= self.consecutive_distractions_for_nudge:
+                self.nudges_sent += 1
+                self.consecutive_distractions = 0
+
+                nudge_reason = f"Consecutive distractions detected: {explanation}"
+                with self.flush_lock:
+                    self.db.add_nudge(self.session_id, nudge_reason, conn=self.writer)
+
+                self.show_notification(
+                    "🎯 Focus Reminder",
+                    f"Get back to: {self.goal}"
+                )
+                print(f"  🔔 NUDGE SENT! (Total: {self.nudges_sent})")
+
+    async def grab_frame(self, deadline: float) -> Optional[tuple]:
+        """
+        Wait until deadline (event loop time), then sample the frontmost window and capture the screen
+        Returns (timestamp, window, capture), with capture None when the last verdict can be reused,
+        or None if stop() was called first
+        """
+        loop = asyncio.get_running_loop()
+        if await self.wait_for_stop(max(0.0, deadline - loop.time())):
+            return None
 
-                # Analyze with Qwen
-                print("  🔍 Analyzing with Qwen...")
-                qwen_start = time.time()
-                description = self.analyze_with_qwen(screenshot_path)
-                qwen_time = time.time() - qwen_start
+        timestamp = datetime.now()
+        print(f"[{timestamp.strftime('%H:%M:%S')}] 📸 Capturing screenshot...")
+
+        # Same frontmost window as the last classified frame: skip capture, Qwen and Claude,
+        # refreshing the verdict every VLM_EVERY_FRAMES frames
+        window = self.window_signature()
+        if (window is not None and window == self._last_window and self._last_verdict is not None
+                and self._frames_since_vlm < VLM_EVERY_FRAMES - 1):
+            self._frames_since_vlm += 1
+            return timestamp, window, None
+
+        self._frames_since_vlm = 0
+        capture = await loop.run_in_executor(self._capture_executor, self.capture_screenshot)
+        return timestamp, window, capture
+
+    async def capture_and_describe(self, frames: asyncio.Queue):
+        """Producer: capture a screenshot every interval and describe it with Qwen"""
+        loop = asyncio.get_running_loop()
+        interval = self.screenshot_interval or 30
+        next_capture = loop.time() + 10  # Initial delay before first capture
+        next_frame = asyncio.create_task(self.grab_frame(next_capture))
+        last_active_check = None
+        try:
+            while True:
+                frame = await next_frame
+                if frame is None:
+                    print("\n🛑 Stop requested. Stopping monitor.")
+                    return
+
+                if last_active_check is None or time.monotonic() - last_active_check >= ACTIVE_CHECK_INTERVAL:
+                    if not self.is_session_active():
+                        print("\n⚠️  Session ended externally. Stopping monitor.")
+                        return
+                    last_active_check = time.monotonic()
+
+                # Prefetch the next frame: it is captured at its deadline even if Qwen is
+                # still working on this one, and never earlier, so it is not stale
+                next_capture = max(next_capture + interval, loop.time())
+                next_frame = asyncio.create_task(self.grab_frame(next_capture))
+
+                timestamp, window, capture = frame
+                if capture is None:
+                    print(f"  ♻️  Same window ({window[0]}), reusing last classification")
+                    await frames.put((timestamp, None, window))
+                    continue
+                screenshot, frame_hash = capture
+
+                # Reuse the description of a near-identical recent frame
+                description = self.cached_description(frame_hash)
+                if description:
+                    print(f"  ♻️  Unchanged screen, reusing description: {description[:80]}...")
+                else:
+                    # Analyze with Qwen
+                    print("  🔍 Analyzing with Qwen...")
+                    qwen_start = time.time()
+                    image_bytes = await asyncio.to_thread(self.encode_screenshot, screenshot)
+                    description = await self.analyze_with_qwen(image_bytes)
+                    qwen_time = time.time() - qwen_start
+
+                    if description:
+                        self.cache_description(frame_hash, description)
+                        print(f"  ✓ Qwen ({qwen_time:.1f}s): {description[:80]}...")
 
                 if description:
-                    print(f"  ✓ Qwen ({qwen_time:.1f}s): {description[:80]}...")
+                    # Blocks only if Claude has fallen two frames behind
+                    await frames.put((timestamp, description, window))
 
-                    # Analyze with Claude
+                print(f"⏳ Next screenshot in {max(0.0, next_capture - loop.time()):.0f} seconds...\n")
+
+        finally:
+            if not next_frame.done():
+                next_frame.cancel()
+
+    async def classify_and_record(self, frames: asyncio.Queue):
+        """Consumer: classify described frames with Claude and record them (the only DB writer)"""
+        while True:
+            frame = await frames.get()
+            if frame is None:
+                break
+            try:
+                timestamp, description, window = frame
+
+                if description is None:
+                    # Unchanged window: record the previous verdict again
+                    self.record_classification(timestamp, *self._last_verdict)
+                else:
+                    # Analyze with Claude while the producer captures the next frame
                     print("  🤖 Analyzing with Claude...")
-                    classification, explanation = self.analyze_with_claude(description)
+                    classification, explanation = await self.analyze_with_claude(description)
 
                     if classification:
                         focused = "FOCUSED" in classification
-
-                        # Store the screenshot analysis in temporary table
-                        self.db.add_screenshot_analysis(
-                            session_id=self.session_id,
-                            timestamp=timestamp,
-                            focused=focused,
-                            explanation=explanation
-                        )
-
-                        # Handle interval tracking
-                        if self.current_interval_focused is None:
-                            # First check - initialize
-                            self.current_interval_start = timestamp
-                            self.current_interval_focused = focused
-                        elif self.current_interval_focused != focused:
-                            # State changed - save old interval and start new one
-                            self.handle_interval_change(focused, timestamp)
-
-                        # Update consecutive distractions
-                        if focused:
-                            self.consecutive_distractions = 0
-                            print(f"  ✅ FOCUSED: {explanation}")
-                        else:
-                            self.consecutive_distractions += 1
-                            print(f"  ⚠️  DISTRACTED: {explanation}")
-                            print(f"  ⚠️  Consecutive: {self.consecutive_distractions}/{self.consecutive_distractions_for_nudge}")
-
-                            # Send nudge if threshold reached
-                            if self.consecutive_distractions >= self.consecutive_distractions_for_nudge:
-                                self.nudges_sent += 1
-                                self.consecutive_distractions = 0
-
-                                nudge_reason = f"Consecutive distractions detected: {explanation}"
-                                self.db.add_nudge(self.session_id, nudge_reason)
-
-                                self.show_notification(
-                                    "🎯 Focus Reminder",
-                                    f"Get back to: {self.goal}"
-                                )
-                                print(f"  🔔 NUDGE SENT! (Total: {self.nudges_sent})")
-
-                # Cleanup screenshot
-                if os.path.exists(screenshot_path):
-                    os.remove(screenshot_path)
-
-                print()
-                print(f"⏳ Waiting {self.screenshot_interval} seconds...\n")
-                time.sleep(30)
-
-        except KeyboardInterrupt:
-            print("\n\n🛑 Monitoring stopped by user")
-
+                        self._last_window = window
+                        self._last_verdict = (focused, explanation)
+                        self.record_classification(timestamp, focused, explanation)
+
+                self.maybe_flush()
+
+                # Keep planner statistics current during long sessions
+                if time.monotonic() - self.last_optimize >= OPTIMIZE_INTERVAL:
+                    self.db.optimize()
+                    self.last_optimize = time.monotonic()
+
+            except Exception as e:
+                # One bad frame must not stop recording; the producer would block on a full queue
+                print(f"❌ Error recording frame: {e}")
+
+    async def monitor_loop(self):
+        """
+        Main monitoring loop, run with asyncio.run
+        Capture + Qwen for the next frame overlaps Claude for the current one
+        Sets done when it returns, however it exits
+        """
+        try:
+            await self._run_loop()
         finally:
-            # Save final interval if exists
-            if self.current_interval_start is not None:
-                self.db.add_interval(
-                    session_id=self.session_id,
-                    time_started=self.current_interval_start,
-                    time_ended=datetime.now(),
-                    focused=self.current_interval_focused
-                )
+            self.done.set()
 
-            # Cleanup temp screenshot
-            if screenshot_path and os.path.exists(screenshot_path):
-                os.remove(screenshot_path)
+    async def _run_loop(self):
+        """Run the capture/classify pipeline on the session writer until stopped"""
+        print(f"\n{'='*60}")
+        print(f"🎯 Monitoring session: {self.goal}")
+        print(f"📸 Taking screenshots every {self.screenshot_interval} seconds")
+        print(f"🔔 Will nudge after {self.consecutive_distractions_for_nudge} consecutive distractions")
+        print(f"{'='*60}\n")
+        print("Press Ctrl+C to stop\n")
 
-            print("\n✓ Monitoring session complete")
+        frames = asyncio.Queue(maxsize=2)
+
+        self._loop = asyncio.get_running_loop()
+        if self._stop.is_set():
+            self._wake.set()
+        # Lets a CLI run be stopped with `kill -USR1 <pid>` (signals only reach the main thread)
+        use_signal = hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread()
+        if use_signal:
+            self._loop.add_signal_handler(signal.SIGUSR1, self.stop)
+
+        with self.db.session_writer() as writer:
+            self.writer = writer
+            producer = asyncio.create_task(self.capture_and_describe(frames))
+            consumer = asyncio.create_task(self.classify_and_record(frames))
+            try:
+                # If the consumer ever exits first, stop rather than leave the producer
+                # blocked on a full queue
+                await asyncio.wait({producer, consumer}, return_when=asyncio.FIRST_COMPLETED)
+                if producer.done():
+                    producer.result()
+                    # Let Claude finish the frames already captured
+                    await frames.put(None)
+                    await consumer
+                else:
+                    print("\n❌ Recording stopped unexpectedly. Stopping monitor.")
+                    consumer.result()
+
+            except asyncio.CancelledError:
+                # Ctrl+C under asyncio.run cancels this task; finish cleanly instead
+                print("\n\n🛑 Monitoring stopped by user")
+
+            finally:
+                for task in (producer, consumer):
+                    if not task.done():
+                        task.cancel()
+                await asyncio.gather(producer, consumer, return_exceptions=True)
+
+                # Save final interval if exists
+                if self.current_interval_start is not None:
+                    self.add_interval(
+                        time_started=self.current_interval_start,
+                        time_ended=datetime.now(),
+                        focused=self.current_interval_focused
+                    )
+                self.flush()
+
+                await asyncio.get_running_loop().run_in_executor(self._capture_executor, self.close_capture)
+                self._capture_executor.shutdown()
+                await self.anthropic_client.close()
+                await self.ollama_client.close()
+
+                if use_signal:
+                    self._loop.remove_signal_handler(signal.SIGUSR1)
+                self._loop = None
+
+                # Later flushes (e.g. from get_session_summary) go through the pool
+                with self.flush_lock:
+                    self.writer = None
+
+        print("\n✓ Monitoring session complete")
 
     def get_session_summary(self) -> dict:
         """Generate summary statistics for the session based on screenshot analyses (source of truth)"""
-        analyses = self.db.get_screenshot_analyses(self.session_id)
+        self.flush()
+        # Durations come from julianday() in SQL, so no timestamps are parsed in Python;
+        # each analysis lasts until the next screenshot and the last one lasts one interval
+        durations = self.db.get_session_duration_summary(
+            self.session_id, last_duration=self.screenshot_interval or 30
+        )
         nudges = self.db.get_session_nudges(self.session_id)
 
-        if not analyses:
-            return {
-                "productive_time": 0,
-                "not_productive_time": 0,
-                "focus_percentage": 0,
-                "nudges_received": len(nudges)
-            }
-
-        # Each analysis represents ~30 seconds of time (the screenshot interval)
-        # Use actual timestamps to calculate more accurate durations
-        productive_time = 0
-        not_productive_time = 0
-
-        for i, analysis in enumerate(analyses):
-            # Calculate duration: time until next screenshot, or estimate for last one
-            if i < len(analyses) - 1:
-                current_time = datetime.fromisoformat(analysis["timestamp"])
-                next_time = datetime.fromisoformat(analyses[i + 1]["timestamp"])
-                duration = int((next_time - current_time).total_seconds())
-            else:
-                # For the last analysis, use the screenshot interval (default ~30 seconds)
-                # or time since last screenshot
-                duration = self.screenshot_interval if self.screenshot_interval > 0 else 30
-
-            if analysis["focused"]:
-                productive_time += duration
-            else:
-                not_productive_time += duration
-
-        total_time = productive_time + not_productive_time
-        focus_percentage = (productive_time / total_time * 100) if total_time > 0 else 0
+        productive_time = durations["productive_time"]
+        not_productive_time = durations["not_productive_time"]
+        focus_percentage = metrics.focus_percentage(productive_time, not_productive_time)
 
         return {
             "productive_time": productive_time,
@@ -301,7 +660,7 @@ if __name__ == "__main__":
     goal = " ".join(sys.argv[2:])
 
     monitor = FocusMonitor(session_id, goal)
-    monitor.monitor_loop()
+    asyncio.run(monitor.monitor_loop())
 
     # Print summary
     print("\n📊 Generating session summary...")
@@ -3,6 +3,10 @@ import { Link, useParams, useNavigate } from 'react-router-dom';
 import SessionTimeline from '../SessionTimeline';
 import { api } from '../../services/api';
 
+// Give up waiting on background analysis after ~3 minutes
+const ANALYSIS_POLL_MS = 2000;
+const MAX_ANALYSIS_POLLS = 90;
+
 export default function PastSession() {
   const { sessionId } = useParams();
   const navigate = useNavigate();
@@ -76,9 +80,23 @@ export default function PastSession() {
       setIsEnding(true);
       setError(null);
 
-      const result = await api.stopMonitoring(sessionId);
+      await api.stopMonitoring(sessionId);
+
+      // Analysis runs in the background; poll until the session is completed
+      let sessionData = await api.getSession(sessionId);
+      for (let attempt = 0; sessionData.status === 'analyzing'; attempt++) {
+        if (attempt >= MAX_ANALYSIS_POLLS) {
+          throw new Error('Session analysis is taking longer than expected, please check back later');
+        }
+        await new Promise((resolve) => setTimeout(resolve, ANALYSIS_POLL_MS));
+        sessionData = await api.getSession(sessionId);
+      }
+
+      if (sessionData.status !== 'completed') {
+        throw new Error('Session analysis failed, please try again');
+      }
 
-      setSession(result.session);
+      setSession(sessionData);
 
       alert('Session ended and analyzed! Refreshing data...');
       await loadSession();